@@ -0,0 +1,48 @@
+"""Проверка нарезки текста дашборда: truncate_html и split_into_messages.
+
+Длинная строка заявки (например, с комментарием на несколько тысяч символов)
+должна обрезаться до лимита, сохранив начало текста, не разрывая теги и
+сущности и закрывая вложенные теги. Сеть и база не нужны:
+
+    python -m benchmarks.dashboard_text
+"""
+import sys
+
+from utils.dashboard_updater import MESSAGE_LIMIT, truncate_html, split_into_messages, closing_tags_for
+
+LONG_LINE = ('— @user Мне нужны 100 долларов. <a href="https://t.me/c/1/2">*тык*</a>\n'
+             '<i>Комментарий: ' + 'я &amp; ты ' * 900 + '</i>')
+
+
+def is_balanced(text: str):
+    return closing_tags_for(text) == ""
+
+
+def check(name: str, passed: bool, failures: list):
+    print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    if not passed:
+        failures.append(name)
+
+
+def main():
+    failures = []
+    text = truncate_html('<i>' + 'y' * 100 + '</i>', 50)
+    check("nested tag keeps its text", text == '<i>' + 'y' * 42 + '…</i>', failures)
+    text = truncate_html('ab<i>' + 'y' * 10 + '</i>', 12)
+    check("tag opened near the cut", text == 'ab<i>yy…</i>', failures)
+    text = truncate_html('<b><i>' + 'y' * 100 + '</i></b>', 40)
+    check("two nested tags closed in order", text.endswith('…</i></b>') and len(text) == 40, failures)
+    text = truncate_html('x' * 10 + '&amp;' + 'y' * 10, 13)
+    check("entity is not split", text == 'x' * 10 + '…', failures)
+
+    text = truncate_html(LONG_LINE, 3990)
+    check("long comment keeps most of its text",
+          len(text) <= 3990 and text.count('я &amp; ты') > 300 and is_balanced(text), failures)
+    chunks = split_into_messages("<b>USD → TJS</b>", ["короткая строка", LONG_LINE, "еще одна"])
+    check("every message fits the limit", all(len(chunk) <= MESSAGE_LIMIT for chunk in chunks), failures)
+    check("no line dropped", "короткая строка" in chunks[0] and "еще одна" in chunks[-1], failures)
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
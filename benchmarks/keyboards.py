@@ -0,0 +1,62 @@
+"""Сборка клавиатур мастера: без кэша и из кэша keyboards.inline.
+
+Для клавиатуры каждого шага печатает время одного вызова и объем памяти,
+выделенной за вызов (tracemalloc), при сборке через InlineKeyboardBuilder
+(__wrapped__ у cached_keyboard) и при повторном вызове закэшированной функции.
+
+    python -m benchmarks.keyboards --calls 20000
+"""
+import argparse
+import time
+import tracemalloc
+
+from handlers.wizard import STEPS, STEPS_BY_NAME, DEFAULT_AMOUNTS, back_targets
+from keyboards import inline
+
+
+def step_keyboards():
+    for step in STEPS:
+        if step.is_choice:
+            buttons = next(iter(step.buttons.values()))
+            yield step.name, inline.get_choice_kb, (step.name, buttons, step.columns), {"back_to": back_targets(step)[0]}
+    yield "amount", inline.get_amount_kb, (DEFAULT_AMOUNTS,), {"back_to": "request_type"}
+    yield "show_matches", inline.get_show_matches_kb, (), {"back_to": back_targets(STEPS_BY_NAME["show_matches"])[0]}
+    yield "confirm", inline.get_confirm_kb, (), {"back_to": back_targets(STEPS_BY_NAME["confirm"])[0]}
+    yield "my requests", inline.get_my_requests_kb, (tuple(range(1, 6)),), {}
+
+
+def time_per_call(fn, args, kwargs, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(*args, **kwargs)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def bytes_per_call(fn, args, kwargs, calls):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [fn(*args, **kwargs) for _ in range(calls)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    del keep
+    return allocated / calls
+
+
+def main(calls: int):
+    print(f"{'step':<16}{'build, us':>12}{'cached, us':>12}{'build, B':>12}{'cached, B':>12}")
+    for name, cached, args, kwargs in step_keyboards():
+        cached(*args, **kwargs)
+        build = cached.__wrapped__
+        print(f"{name:<16}"
+              f"{time_per_call(build, args, kwargs, calls):>12.2f}"
+              f"{time_per_call(cached, args, kwargs, calls):>12.2f}"
+              f"{bytes_per_call(build, args, kwargs, min(calls, 1000)):>12.0f}"
+              f"{bytes_per_call(cached, args, kwargs, min(calls, 1000)):>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.calls)
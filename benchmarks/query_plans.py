@@ -0,0 +1,106 @@
+"""Планы горячих запросов к requests до и после индексов из миграции 2.
+
+Создает временную схему в базе из .env, наполняет ее синтетическими данными,
+печатает EXPLAIN ANALYZE для каждого запроса на схеме версии 1, затем
+применяет миграцию 2 и печатает планы еще раз. Схема удаляется в конце.
+
+    python -m benchmarks.query_plans --users 5000 --requests 200000
+"""
+import argparse
+import asyncio
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import DATABASE_URL
+from db.migrations import run_migrations
+
+SCHEMA = f"bench_{os.getpid()}"
+
+HOT_QUERIES = {
+    "active list": """
+        SELECT * FROM requests WHERE status = 'ACTIVE' ORDER BY created_at
+    """,
+    "matching": """
+        SELECT * FROM requests
+        WHERE status = 'ACTIVE' AND user_id != 42 AND request_type = 'give'
+          AND currency_from = 'USD' AND currency_to = 'TJS'
+          AND money_type_from = 'cash' AND money_type_to = 'online'
+          AND location_from = 'dushanbe' AND location_to = 'dushanbe'
+        ORDER BY created_at DESC
+    """,
+    "my requests": """
+        SELECT * FROM requests WHERE user_id = 42 AND status = 'ACTIVE' ORDER BY created_at DESC
+    """,
+    "popular amounts": """
+        SELECT amount FROM (
+            SELECT amount, max(id) AS max_id FROM requests WHERE user_id = 42 GROUP BY amount
+        ) AS subquery ORDER BY max_id DESC LIMIT 4
+    """,
+}
+
+SEED_USERS = """
+    INSERT INTO users (telegram_id, username, first_name)
+    SELECT g, 'user' || g, 'User ' || g FROM generate_series(1, :users) AS g
+"""
+
+SEED_REQUESTS = """
+    INSERT INTO requests (user_id, request_type, currency_from, money_type_from, location_from, amount,
+                          currency_to, money_type_to, location_to, status, message_text, created_at)
+    SELECT 1 + (random() * (:users - 1))::int,
+           (ARRAY['take', 'give'])[1 + (random())::int],
+           (ARRAY['USD', 'TJS', 'UZS', 'RUB'])[1 + (random() * 3)::int],
+           (ARRAY['cash', 'online'])[1 + (random())::int],
+           (ARRAY['dushanbe', 'tashkent', 'moscow'])[1 + (random() * 2)::int],
+           (ARRAY[100, 500, 1000, 5000])[1 + (random() * 3)::int],
+           (ARRAY['USD', 'TJS', 'UZS', 'RUB'])[1 + (random() * 3)::int],
+           (ARRAY['cash', 'online'])[1 + (random())::int],
+           (ARRAY['dushanbe', 'tashkent', 'moscow'])[1 + (random() * 2)::int],
+           CASE WHEN random() < :active_share THEN 'ACTIVE' ELSE 'CLOSED' END,
+           'benchmark request',
+           now() - random() * interval '365 days'
+    FROM generate_series(1, :requests)
+"""
+
+
+async def explain_all(engine, title):
+    print(f"\n===== {title} =====")
+    async with engine.connect() as conn:
+        await conn.execute(text("ANALYZE requests"))
+        for name, query in HOT_QUERIES.items():
+            result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"))
+            print(f"\n--- {name} ---")
+            for line in result.scalars().all():
+                print(line)
+
+
+async def main(users: int, requests: int, active_share: float):
+    admin_engine = create_async_engine(DATABASE_URL)
+    engine = create_async_engine(DATABASE_URL, connect_args={"server_settings": {"search_path": SCHEMA}})
+    async with admin_engine.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    try:
+        await run_migrations(engine, target=1)
+        async with engine.begin() as conn:
+            await conn.execute(text(SEED_USERS), {"users": users})
+            await conn.execute(text(SEED_REQUESTS),
+                               {"users": users, "requests": requests, "active_share": active_share})
+
+        await explain_all(engine, "before: schema version 1")
+        await run_migrations(engine, target=2)
+        await explain_all(engine, "after: schema version 2")
+    finally:
+        await engine.dispose()
+        async with admin_engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--active-share", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.requests, args.active_share))
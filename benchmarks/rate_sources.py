@@ -0,0 +1,105 @@
+"""Проверка RateProvider на локальном фейковом HTTP-сервере вместо alif.tj.
+
+Поднимает aiohttp-сервер на 127.0.0.1 с ответами в формате Alif (рабочий,
+медленный, падающий и пустой) и проверяет: переход к следующему источнику
+при ошибке, размыкание circuit breaker, stale-while-revalidate и холодный
+старт из снимка на диске, в том числе при одновременных первых вызовах.
+Сеть наружу не нужна:
+
+    python -m benchmarks.rate_sources --slow-ms 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from utils.rates_client import AlifRateSource, RateProvider, close_session
+
+ALIF_RESPONSE = {"localRates": [
+    {"name": "USD", "buyValue": "10.90", "sellValue": "11.05"},
+    {"name": "RUB", "buyValue": "0.118", "sellValue": "0.125"},
+]}
+
+
+async def start_fake_server(slow: float):
+    hits = Counter()
+
+    async def ok(request):
+        hits["ok"] += 1
+        return web.json_response(ALIF_RESPONSE)
+
+    async def slow_ok(request):
+        hits["slow"] += 1
+        await asyncio.sleep(slow)
+        return web.json_response(ALIF_RESPONSE)
+
+    async def broken(request):
+        hits["broken"] += 1
+        return web.Response(status=502)
+
+    async def empty(request):
+        hits["empty"] += 1
+        return web.json_response({"localRates": []})
+
+    app = web.Application()
+    app.add_routes([web.get("/ok", ok), web.get("/slow", slow_ok), web.get("/broken", broken), web.get("/empty", empty)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", hits
+
+
+def check(name: str, passed: bool, failures: list):
+    print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    if not passed:
+        failures.append(name)
+
+
+async def main(slow: float):
+    runner, base_url, hits = await start_fake_server(slow)
+    failures = []
+    cache_path = os.path.join(tempfile.mkdtemp(), "rates_snapshot.json")
+    try:
+        provider = RateProvider([AlifRateSource(f"{base_url}/broken", name="broken"),
+                                 AlifRateSource(f"{base_url}/empty", name="empty"),
+                                 AlifRateSource(f"{base_url}/ok", name="ok")], ttl=0, cache_path=cache_path)
+        rates = await provider.refresh()
+        check("fallback to the next source", rates is not None and provider.source_name == "ok", failures)
+        check("TJS added to parsed rates", rates is not None and rates.get("TJS") == {"buy": 1.0, "sell": 1.0}, failures)
+
+        for _ in range(5):
+            await provider.refresh()
+        threshold = provider.breakers["broken"].threshold
+        check(f"breaker opens after {threshold} failures", hits["broken"] == threshold, failures)
+
+        slow_provider = RateProvider([AlifRateSource(f"{base_url}/slow", name="slow")], ttl=0, cache_path=None)
+        await slow_provider.refresh()
+        start = time.perf_counter()
+        await slow_provider.get_rates()
+        elapsed = time.perf_counter() - start
+        check(f"stale snapshot served without waiting ({elapsed * 1000:.1f} ms)", elapsed < slow / 2, failures)
+        await slow_provider.refresh()
+
+        network_hits = sum(hits.values())
+        cold = RateProvider([AlifRateSource(f"{base_url}/broken", name="broken")], ttl=3600, cache_path=cache_path)
+        results = await asyncio.gather(*(cold.get_rates() for _ in range(10)))
+        check("cold start from disk snapshot", all(result == rates for result in results), failures)
+        check("concurrent first calls do not hit the network", sum(hits.values()) == network_hits, failures)
+    finally:
+        await close_session()
+        await runner.cleanup()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slow-ms", type=float, default=500)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args.slow_ms / 1000)) else 0)
@@ -0,0 +1,110 @@
+"""Обращения к FSM-хранилищу на один клик мастера CreateRequest.
+
+Хранилище — MemoryStorage с искусственной задержкой на каждый вызов
+(задается в миллисекундах, подставьте задержку своего прод-хранилища).
+Сравниваются два варианта одного и того же шага мастера:
+
+* before — как обработчики работали раньше: update_data, затем get_data
+  в обработчике и еще раз в show_*_step, затем set_state;
+* after — StateContext: одно чтение данных, правки в памяти, одна запись
+  данных и одна запись состояния в конце апдейта.
+
+Чтение состояния FSMContextMiddleware (нужно фильтрам) есть в обоих вариантах.
+
+    python -m benchmarks.wizard_state --latency-ms 2 --clicks 1000
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from handlers.fsm import CreateRequest
+from middlewares.state_context import StateContext
+
+
+class LatencyStorage(MemoryStorage):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    async def seed(self, key, state, data):
+        await super().set_state(key, state)
+        await super().set_data(key, data)
+
+    async def _round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def set_state(self, key, state=None):
+        await self._round_trip()
+        await super().set_state(key, state)
+
+    async def get_state(self, key):
+        await self._round_trip()
+        return await super().get_state(key)
+
+    async def set_data(self, key, data):
+        await self._round_trip()
+        await super().set_data(key, data)
+
+    async def get_data(self, key):
+        await self._round_trip()
+        return await super().get_data(key)
+
+    async def update_data(self, key, data):
+        # Один запрос, как у хранилищ с атомарным обновлением
+        await self._round_trip()
+        current = await super().get_data(key)
+        current.update(data)
+        await super().set_data(key, current)
+        return current.copy()
+
+
+async def click_before(fsm: FSMContext, currency: str):
+    # process_money_type_from до перехода на StateContext
+    await fsm.get_state()
+    await fsm.update_data(money_type_from_key='online', money_type_from_value='онлайн')
+    data = await fsm.get_data()
+    if data.get("currency_from_key") == currency:
+        await fsm.update_data(location_from_key='dushanbe', location_from_value='в Душанбе')
+    await fsm.get_data()
+    await fsm.set_state(CreateRequest.money_type_to)
+
+
+async def click_after(fsm: FSMContext, currency: str):
+    ctx = StateContext(fsm, await fsm.get_state(), await fsm.get_data())
+    ctx.update(money_type_from_key='online', money_type_from_value='онлайн')
+    if ctx.data.get("currency_from_key") == currency:
+        ctx.update(location_from_key='dushanbe', location_from_value='в Душанбе')
+    ctx.set_state(CreateRequest.money_type_to)
+    await ctx.commit()
+
+
+async def run(click, latency: float, clicks: int):
+    storage = LatencyStorage(latency)
+    fsm = FSMContext(storage, StorageKey(bot_id=1, chat_id=1, user_id=1))
+    elapsed = 0.0
+    for _ in range(clicks):
+        await storage.seed(fsm.key, CreateRequest.money_type_from, {"currency_from_key": "TJS", "amount": 100.0})
+        start = time.perf_counter()
+        await click(fsm, "TJS")
+        elapsed += time.perf_counter() - start
+    return storage.calls / clicks, elapsed / clicks * 1000
+
+
+async def main(latency_ms: float, clicks: int):
+    for name, click in (("before", click_before), ("after", click_after)):
+        calls, ms = await run(click, latency_ms / 1000, clicks)
+        print(f"{name:>6}: {calls:.1f} storage calls per click, {ms:.2f} ms per click")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--clicks", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency_ms, args.clicks))
@@ -13,5 +13,70 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_COMPILED_CACHE_SIZE = int(os.getenv("DB_COMPILED_CACHE_SIZE", 500))
+
+# Реплика для чтения; без DB_REPLICA_HOST все запросы идут в основную базу
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DATABASE_REPLICA_URL = (f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+                        if DB_REPLICA_HOST else None)
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 10))
+
 DASHBOARD_MESSAGE_ID = os.getenv("DASHBOARD_MESSAGE_ID")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
+
+RATES_URL = os.getenv("RATES_URL", "https://alif.tj/api/rates")
+RATES_CACHE_TTL = int(os.getenv("RATES_CACHE_TTL", 60))
+RATES_TIMEOUT = float(os.getenv("RATES_TIMEOUT", 5))
+RATES_POLL_INTERVAL = int(os.getenv("RATES_POLL_INTERVAL", 60))
+RATES_CACHE_PATH = os.getenv("RATES_CACHE_PATH", "rates_snapshot.json")
+RATES_BREAKER_THRESHOLD = int(os.getenv("RATES_BREAKER_THRESHOLD", 3))
+RATES_BREAKER_RESET = float(os.getenv("RATES_BREAKER_RESET", 60))
+# Снимки курсов старше стольких дней удаляются (конвертеру нужны последние сутки)
+RATES_RETENTION_DAYS = int(os.getenv("RATES_RETENTION_DAYS", 30))
+RATES_PRUNE_INTERVAL = int(os.getenv("RATES_PRUNE_INTERVAL", 3600))
+DASHBOARD_DEBOUNCE = float(os.getenv("DASHBOARD_DEBOUNCE", 2))
+DASHBOARD_MIN_INTERVAL = float(os.getenv("DASHBOARD_MIN_INTERVAL", 5))
+MATCH_AMOUNT_TOLERANCE = float(os.getenv("MATCH_AMOUNT_TOLERANCE", 0.2))
+MATCH_MAX_PARTS = int(os.getenv("MATCH_MAX_PARTS", 5))
+NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", 2))
+NOTIFY_RATE_PER_SEC = float(os.getenv("NOTIFY_RATE_PER_SEC", 20))
+ROUTE_MAX_HOPS = int(os.getenv("ROUTE_MAX_HOPS", 3))
+ROUTE_MAX_BRANCH = int(os.getenv("ROUTE_MAX_BRANCH", 10))
+ROUTE_AMOUNT_TOLERANCE = float(os.getenv("ROUTE_AMOUNT_TOLERANCE", 0.5))
+ROUTE_LIMIT = int(os.getenv("ROUTE_LIMIT", 3))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", 3600))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 7))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+REQUEST_TTL_DAYS = int(os.getenv("REQUEST_TTL_DAYS", 7))
+EXPIRY_CHECK_INTERVAL = int(os.getenv("EXPIRY_CHECK_INTERVAL", 300))
+GROUP_EDIT_RATE_PER_SEC = float(os.getenv("GROUP_EDIT_RATE_PER_SEC", 0.3))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", 30))
+# Пусто — FSM хранится в основной базе; для одного инстанса можно указать
+# sqlite+aiosqlite:///fsm.db (нужен пакет aiosqlite)
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL")
+# По умолчанию FSM читается из базы и пишется в нее на каждом вызове, так что
+# инстансы делят шаги мастера. Отложенная запись (FSM_FLUSH_INTERVAL, сек) и
+# кэш чтения (FSM_CACHE_TTL, сек) безопасны только для одного инстанса или
+# при привязке чата к инстансу: иначе другой инстанс увидит старое состояние
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 0))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", 0))
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", 1024))
+# Глобальный лимит Telegram — около 30 сообщений в секунду на бота
+BROADCAST_RATE_PER_SEC = float(os.getenv("BROADCAST_RATE_PER_SEC", 25))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 10))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", 200))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 5))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", 5))
+# После стольких неудачных доставок подряд пользователь считается недоступным
+# и пропускается рассылками, пока снова не напишет боту
+DELIVERY_MAX_FAILURES = int(os.getenv("DELIVERY_MAX_FAILURES", 3))
+DELIVERY_FLUSH_INTERVAL = float(os.getenv("DELIVERY_FLUSH_INTERVAL", 30))
@@ -1,19 +1,137 @@
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .models import Base
-from config import DATABASE_URL
+from config import (DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                    DB_STATEMENT_CACHE_SIZE, DB_COMPILED_CACHE_SIZE, DATABASE_REPLICA_URL, READ_YOUR_WRITES_WINDOW)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Замеряет, сколько обработчик ждал свободное соединение из пула.
+    # У каждого пула (основная база, реплика) свои метрики
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
 
-async_engine = create_async_engine(DATABASE_URL, echo=False)
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
 
+
+def make_engine(url: str):
+    return create_async_engine(
+        url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        query_cache_size=DB_COMPILED_CACHE_SIZE,
+        connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE})
+
+
+async_engine = make_engine(DATABASE_URL)
 async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
 
+# Без настроенной реплики фабрика чтения указывает на основную базу
+replica_engine = make_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else async_engine
+replica_session_factory = async_sessionmaker(replica_engine, expire_on_commit=False)
 
-async def create_tables():
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        print("Database tables created.")
+
+class ReadRouter:
+    # Выбирает базу для чтения. Реплика отстает от основной базы, поэтому
+    # пользователь, который только что создал или закрыл заявку, еще window
+    # секунд читает из основной базы и видит свои изменения
+    def __init__(self, primary: async_sessionmaker, replica: async_sessionmaker,
+                 window: float = READ_YOUR_WRITES_WINDOW):
+        self.primary = primary
+        self.replica = replica
+        self.window = window
+        self.recent_writers = {}
+
+    def mark_write(self, user_id: int):
+        now = time.monotonic()
+        if len(self.recent_writers) > 1000:
+            self.recent_writers = {uid: deadline for uid, deadline in self.recent_writers.items() if deadline > now}
+        self.recent_writers[user_id] = now + self.window
+
+    def factory_for(self, user_id: int = None):
+        if user_id is not None:
+            deadline = self.recent_writers.get(user_id)
+            if deadline is not None:
+                if deadline > time.monotonic():
+                    return self.primary
+                del self.recent_writers[user_id]
+        return self.replica
+
+    def session(self, user_id: int = None):
+        return self.factory_for(user_id)()
+
+
+read_router = ReadRouter(async_session_factory, replica_session_factory)
+
+
+def read_session(user_id: int = None):
+    # Сессия только для чтения: реплика, если пользователь недавно ничего не менял
+    return read_router.session(user_id)
+
+
+def mark_write(user_id: int):
+    read_router.mark_write(user_id)
+
+
+def get_pool_stats(engine=async_engine):
+    pool = engine.sync_engine.pool
+    metrics = pool.metrics
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checkouts": metrics.checkouts,
+        "timeouts": metrics.timeouts,
+        "avg_wait_ms": metrics.total_wait / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+        "max_wait_ms": metrics.max_wait * 1000,
+    }
+
+
+def get_all_pool_stats():
+    # Подпись пула -> его статистика; реплика — только если настроена отдельно
+    stats = {"Основная база": get_pool_stats(async_engine)}
+    if replica_engine is not async_engine:
+        stats["Реплика"] = get_pool_stats(replica_engine)
+    return stats
 
 
 async def delete_tables():
     async with async_engine.begin() as conn:
+        # Архив ссылается на тип request_status, который удаляет drop_all, а в метаданных его нет
+        await conn.execute(text("DROP TABLE IF EXISTS requests_history CASCADE"))
         await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
         print("Database tables deleted.")
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import FSM_STORAGE_URL, FSM_FLUSH_INTERVAL, FSM_CACHE_TTL
+from .database import async_engine
+from .models import FsmState
+
+fsm_table = FsmState.__table__
+
+
+class CachedRecord:
+    __slots__ = ('state', 'data', 'loaded_at')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self.loaded_at = time.monotonic()
+
+
+class SqlStorage(BaseStorage):
+    # FSM в таблице fsm_states (Postgres или SQLite). При flush_interval = 0 и
+    # cache_ttl = 0 (по умолчанию) каждое чтение идет в базу, а каждая запись
+    # сразу в нее уходит — инстансы видят шаги друг друга.
+    # Для одного инстанса можно включить кэш в памяти: с flush_interval > 0
+    # изменения копятся и раз в flush_interval уходят одним executemany, а
+    # чистая запись кэша живет cache_ttl секунд
+    def __init__(self, engine: AsyncEngine, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 cache_ttl: float = FSM_CACHE_TTL, key_builder: KeyBuilder = None):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.cache = {}
+        self.dirty = set()
+        self._task = None
+
+        insert = postgresql.insert if engine.dialect.name == 'postgresql' else sqlite.insert
+        upsert = insert(fsm_table).values(
+            key=bindparam('b_key'), state=bindparam('b_state'), data=bindparam('b_data'), updated_at=func.now())
+        self._upsert = upsert.on_conflict_do_update(
+            index_elements=[fsm_table.c.key],
+            set_={'state': upsert.excluded.state, 'data': upsert.excluded.data, 'updated_at': func.now()})
+        self._delete = delete(fsm_table).where(fsm_table.c.key.in_(bindparam('keys', expanding=True)))
+        self._select = select(fsm_table.c.state, fsm_table.c.data).where(fsm_table.c.key == bindparam('key'))
+
+    @classmethod
+    def from_url(cls, url: str = FSM_STORAGE_URL, **kwargs):
+        return cls(create_async_engine(url) if url else async_engine, **kwargs)
+
+    async def _record(self, key: StorageKey):
+        storage_key = self.key_builder.build(key)
+        record = self.cache.get(storage_key)
+        if record is not None and (storage_key in self.dirty or time.monotonic() - record.loaded_at < self.cache_ttl):
+            return storage_key, record
+
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self._select, {'key': storage_key})
+            row = result.first()
+        loaded = CachedRecord(row.state, dict(row.data)) if row else CachedRecord(None, {})
+        # Пока шел запрос, запись могла измениться в этом же процессе — ее не затираем
+        if storage_key in self.dirty:
+            return storage_key, self.cache[storage_key]
+        if self.cache_ttl > 0:
+            self.cache[storage_key] = loaded
+        return storage_key, loaded
+
+    async def _mark_dirty(self, storage_key: str, record: CachedRecord):
+        # Только что записанное значение свежее базы, перечитывать его незачем
+        record.loaded_at = time.monotonic()
+        self.cache[storage_key] = record
+        self.dirty.add(storage_key)
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key, record = await self._record(key)
+        record.data = dict(data)
+        await self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        storage_key, record = await self._record(key)
+        record.data.update(data)
+        await self._mark_dirty(storage_key, record)
+        return record.data.copy()
+
+    async def flush(self):
+        if not self.dirty:
+            return 0
+        keys, self.dirty = self.dirty, set()
+        upserts, deletes = [], []
+        for storage_key in keys:
+            record = self.cache[storage_key]
+            if record.state is None and not record.data:
+                deletes.append(storage_key)
+            else:
+                upserts.append({'b_key': storage_key, 'b_state': record.state, 'b_data': dict(record.data)})
+        try:
+            async with self.engine.begin() as conn:
+                if upserts:
+                    await conn.execute(self._upsert, upserts)
+                if deletes:
+                    await conn.execute(self._delete, {'keys': deletes})
+        except Exception:
+            self.dirty |= keys
+            raise
+
+        now = time.monotonic()
+        for storage_key, record in list(self.cache.items()):
+            if storage_key not in self.dirty and now - record.loaded_at >= self.cache_ttl:
+                del self.cache[storage_key]
+        return len(keys)
+
+    async def start(self):
+        if self.engine.dialect.name != 'postgresql':
+            # На Postgres таблицу создает миграция 6, SQLite-файл готовим сами
+            async with self.engine.begin() as conn:
+                await conn.run_sync(fsm_table.create, checkfirst=True)
+        if self.flush_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush FSM storage: {e}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self.engine is not async_engine:
+            await self.engine.dispose()
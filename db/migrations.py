@@ -0,0 +1,214 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import REQUEST_TTL_DAYS
+from .database import async_engine
+
+# Каждая миграция — (версия, описание, список SQL-выражений). Применяются по
+# порядку, каждая в своей транзакции; примененные версии пишутся в schema_migrations.
+# Уже выпущенные миграции не редактируются — изменения схемы добавляются новой версией.
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL UNIQUE,
+            username VARCHAR(32),
+            first_name VARCHAR(64) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users (telegram_id),
+            request_type VARCHAR(10) NOT NULL,
+            currency_from VARCHAR(50) NOT NULL,
+            money_type_from VARCHAR(50) NOT NULL,
+            location_from VARCHAR(50) NOT NULL,
+            amount NUMERIC(10, 2) NOT NULL,
+            currency_to VARCHAR(50) NOT NULL,
+            money_type_to VARCHAR(50) NOT NULL,
+            location_to VARCHAR(50) NOT NULL,
+            comment TEXT,
+            status VARCHAR(10) NOT NULL,
+            group_message_id BIGINT,
+            message_text TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            closed_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rate_snapshots (
+            id SERIAL PRIMARY KEY,
+            currency VARCHAR(10) NOT NULL,
+            buy NUMERIC(12, 4) NOT NULL,
+            sell NUMERIC(12, 4) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_rate_snapshots_currency_created_at ON rate_snapshots (currency, created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_shards (
+            id SERIAL PRIMARY KEY,
+            shard_key VARCHAR(32) NOT NULL UNIQUE,
+            message_id BIGINT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (2, "requests hot-path indexes", [
+        # Частичный индекс: только активные заявки, все колонки поиска совпадений
+        """
+        CREATE INDEX IF NOT EXISTS ix_requests_active_match ON requests
+            (request_type, currency_from, currency_to, money_type_from, money_type_to,
+             location_from, location_to, amount)
+            WHERE status = 'ACTIVE'
+        """,
+        # /my: заявки пользователя по статусу, новые первыми
+        "CREATE INDEX IF NOT EXISTS ix_requests_user_status_created ON requests (user_id, status, created_at)",
+        # Популярные суммы пользователя: index-only scan по (user_id, amount, id)
+        "CREATE INDEX IF NOT EXISTS ix_requests_user_amount_id ON requests (user_id, amount, id)",
+    ]),
+    (3, "group outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS group_outbox (
+            id SERIAL PRIMARY KEY,
+            request_id INTEGER NOT NULL REFERENCES requests (id),
+            text TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_group_outbox_next_attempt_at ON group_outbox (next_attempt_at)",
+    ]),
+    (4, "request status enum and partitioned history", [
+        "CREATE TYPE request_status AS ENUM ('ACTIVE', 'CLOSED')",
+        # Предикат частичного индекса ссылается на status — пересоздаем его после смены типа
+        "DROP INDEX IF EXISTS ix_requests_active_match",
+        "ALTER TABLE requests ALTER COLUMN status TYPE request_status USING status::request_status",
+        """
+        CREATE INDEX ix_requests_active_match ON requests
+            (request_type, currency_from, currency_to, money_type_from, money_type_to,
+             location_from, location_to, amount)
+            WHERE status = 'ACTIVE'
+        """,
+        # Старые закрытые заявки закрывались без closed_at
+        "UPDATE requests SET closed_at = created_at WHERE status <> 'ACTIVE' AND closed_at IS NULL",
+        "CREATE INDEX ix_requests_archivable ON requests (closed_at) WHERE status <> 'ACTIVE'",
+        # Архив закрытых заявок, партиции по месяцам создает request_archiver
+        """
+        CREATE TABLE requests_history (
+            id INTEGER NOT NULL,
+            user_id BIGINT NOT NULL,
+            request_type VARCHAR(10) NOT NULL,
+            currency_from VARCHAR(50) NOT NULL,
+            money_type_from VARCHAR(50) NOT NULL,
+            location_from VARCHAR(50) NOT NULL,
+            amount NUMERIC(10, 2) NOT NULL,
+            currency_to VARCHAR(50) NOT NULL,
+            money_type_to VARCHAR(50) NOT NULL,
+            location_to VARCHAR(50) NOT NULL,
+            comment TEXT,
+            status request_status NOT NULL,
+            group_message_id BIGINT,
+            message_text TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            closed_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, closed_at)
+        ) PARTITION BY RANGE (closed_at)
+        """,
+    ]),
+    (5, "request expiry", [
+        "ALTER TYPE request_status ADD VALUE IF NOT EXISTS 'EXPIRED'",
+        "ALTER TABLE requests ADD COLUMN expires_at TIMESTAMP",
+        "ALTER TABLE requests_history ADD COLUMN expires_at TIMESTAMP",
+        # Уже открытым заявкам даем полный срок с момента миграции, а не от created_at,
+        # чтобы первый запуск планировщика не закрыл их все разом
+        f"UPDATE requests SET expires_at = now() + make_interval(days => {REQUEST_TTL_DAYS:d}) WHERE status = 'ACTIVE'",
+        "CREATE INDEX ix_requests_active_expires_at ON requests (expires_at) WHERE status = 'ACTIVE'",
+    ]),
+    (6, "fsm storage", [
+        """
+        CREATE TABLE fsm_states (
+            key VARCHAR(255) PRIMARY KEY,
+            state VARCHAR(255),
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (7, "broadcast jobs", [
+        """
+        CREATE TABLE broadcast_jobs (
+            id SERIAL PRIMARY KEY,
+            text TEXT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'RUNNING',
+            cursor BIGINT NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            admin_chat_id BIGINT NOT NULL,
+            progress_message_id BIGINT,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            finished_at TIMESTAMP
+        )
+        """,
+    ]),
+    (8, "user deliverability", [
+        "ALTER TABLE users ADD COLUMN last_delivered_at TIMESTAMP",
+        "ALTER TABLE users ADD COLUMN failed_deliveries INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT false",
+        # Рассылка идет только по доступным пользователям, keyset по telegram_id
+        "CREATE INDEX ix_users_reachable ON users (telegram_id) WHERE NOT is_blocked",
+    ]),
+    (9, "durable group edits", [
+        "ALTER TABLE requests ADD COLUMN group_closed_at TIMESTAMP",
+        # Уже закрытые заявки считаем зачеркнутыми, иначе первый запуск заново
+        # поставил бы в очередь правки всей истории
+        "UPDATE requests SET group_closed_at = closed_at WHERE status <> 'ACTIVE' AND group_message_id IS NOT NULL",
+        """
+        CREATE INDEX ix_requests_group_edit_pending ON requests (id)
+        WHERE status <> 'ACTIVE' AND group_message_id IS NOT NULL AND group_closed_at IS NULL
+        """,
+    ]),
+    (10, "history popular amounts index", [
+        # Тот же индекс, что ix_requests_user_amount_id, для частых сумм из архива
+        "CREATE INDEX ix_requests_history_user_amount_id ON requests_history (user_id, amount, id)",
+    ]),
+]
+
+# Любое число, одинаковое для всех процессов бота: не дает двум инстансам
+# применять миграции одновременно
+MIGRATIONS_LOCK_ID = 727001
+
+
+async def get_applied_versions(engine: AsyncEngine = async_engine):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL DEFAULT now())"))
+        result = await conn.execute(text("SELECT version FROM schema_migrations"))
+        return set(result.scalars().all())
+
+
+async def run_migrations(engine: AsyncEngine = async_engine, target: int = None):
+    applied = await get_applied_versions(engine)
+    for version, name, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        if version in applied:
+            continue
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+            already_applied = await conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"), {"version": version})
+            if already_applied.first():
+                continue
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name})
+        print(f"Applied migration {version}: {name}")
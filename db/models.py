@@ -1,22 +1,45 @@
-from sqlalchemy import (BigInteger, String, Text, DECIMAL, ForeignKey, TIMESTAMP, func)
+from sqlalchemy import (BigInteger, Boolean, Integer, String, Text, DECIMAL, ForeignKey, TIMESTAMP, Index, Enum, JSON,
+                        func, text)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
 class Base(DeclarativeBase): pass
 
 
+REQUEST_STATUSES = ('ACTIVE', 'CLOSED', 'EXPIRED')
+
+
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_reachable', 'telegram_id', postgresql_where=text("NOT is_blocked")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False)
     username: Mapped[str] = mapped_column(String(32), nullable=True)
     first_name: Mapped[str] = mapped_column(String(64), nullable=False)
     created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now())
+    # Состояние доставки: пишет utils.delivery_tracker
+    last_delivered_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, nullable=True)
+    failed_deliveries: Mapped[int] = mapped_column(Integer, nullable=False, server_default='0')
+    is_blocked: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default='false')
 
 
 class Request(Base):
     __tablename__ = 'requests'
+    __table_args__ = (
+        Index('ix_requests_active_match', 'request_type', 'currency_from', 'currency_to', 'money_type_from',
+              'money_type_to', 'location_from', 'location_to', 'amount',
+              postgresql_where=text("status = 'ACTIVE'")),
+        Index('ix_requests_user_status_created', 'user_id', 'status', 'created_at'),
+        Index('ix_requests_user_amount_id', 'user_id', 'amount', 'id'),
+        Index('ix_requests_archivable', 'closed_at', postgresql_where=text("status <> 'ACTIVE'")),
+        Index('ix_requests_active_expires_at', 'expires_at', postgresql_where=text("status = 'ACTIVE'")),
+        Index('ix_requests_group_edit_pending', 'id', postgresql_where=text(
+            "status <> 'ACTIVE' AND group_message_id IS NOT NULL AND group_closed_at IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.telegram_id'))
@@ -30,8 +53,69 @@ class Request(Base):
     money_type_to: Mapped[str] = mapped_column(String(50), nullable=False)
     location_to: Mapped[str] = mapped_column(String(50), nullable=False)
     comment: Mapped[str] = mapped_column(Text, nullable=True)
-    status: Mapped[str] = mapped_column(String(10), default='ACTIVE', nullable=False)
+    status: Mapped[str] = mapped_column(Enum(*REQUEST_STATUSES, name='request_status'), default='ACTIVE', nullable=False)
     group_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
     message_text: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now())
     closed_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, nullable=True)
+    expires_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, nullable=True)
+    # Когда сообщение закрытой заявки в группе зачеркнуто; NULL — правка еще не сделана
+    group_closed_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, nullable=True)
+
+
+class RateSnapshot(Base):
+    __tablename__ = 'rate_snapshots'
+    __table_args__ = (Index('ix_rate_snapshots_currency_created_at', 'currency', 'created_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    currency: Mapped[str] = mapped_column(String(10), nullable=False)
+    buy: Mapped[float] = mapped_column(DECIMAL(12, 4), nullable=False)
+    sell: Mapped[float] = mapped_column(DECIMAL(12, 4), nullable=False)
+    created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
+
+
+class DashboardShard(Base):
+    __tablename__ = 'dashboard_shards'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    shard_key: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
+    message_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now())
+
+
+class GroupOutbox(Base):
+    __tablename__ = 'group_outbox'
+    __table_args__ = (Index('ix_group_outbox_next_attempt_at', 'next_attempt_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    request_id: Mapped[int] = mapped_column(ForeignKey('requests.id'), nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    next_attempt_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
+    created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now())
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON().with_variant(JSONB, 'postgresql'), nullable=False)
+    updated_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
+
+
+class BroadcastJob(Base):
+    __tablename__ = 'broadcast_jobs'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(10), server_default='RUNNING', nullable=False)
+    # telegram_id последнего обработанного получателя: рассылка идет по возрастанию id
+    cursor: Mapped[int] = mapped_column(BigInteger, server_default='0', nullable=False)
+    total: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    sent: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, server_default='0', nullable=False)
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    progress_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    created_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, server_default=func.now())
+    finished_at: Mapped[TIMESTAMP] = mapped_column(TIMESTAMP, nullable=True)
@@ -0,0 +1,213 @@
+from sqlalchemy import (select, insert, update, delete, bindparam, desc, func, text, table, column, union_all, Text,
+                        Interval, Boolean)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
+
+from .models import Request, User, GroupOutbox, BroadcastJob
+
+# Горячие запросы собираются один раз при импорте: ключ кэша скомпилированного SQL
+# у них стабилен, а asyncpg переиспользует подготовленные выражения на соединении.
+# Значения передаются только через bindparam.
+
+USER_ACTIVE_REQUESTS = (
+    select(Request)
+    .where(Request.user_id == bindparam('user_id'), Request.status == 'ACTIVE')
+    .order_by(Request.created_at.desc())
+)
+
+REQUEST_WITH_USER = (
+    select(Request)
+    .where(Request.id == bindparam('request_id'))
+    .options(selectinload(Request.user))
+)
+
+# Архив не в метаданных моделей (его создает миграция 4), нужные колонки описываем здесь
+_requests_history = table('requests_history', column('id'), column('user_id'), column('amount'))
+
+# Частые суммы считаем и по архиву, иначе после переноса старых заявок они пропадают
+_user_amounts = union_all(
+    select(Request.amount, Request.id).where(Request.user_id == bindparam('user_id')),
+    select(_requests_history.c.amount, _requests_history.c.id)
+    .where(_requests_history.c.user_id == bindparam('user_id')),
+).subquery('user_amounts')
+_popular_amounts = (
+    select(_user_amounts.c.amount, func.max(_user_amounts.c.id).label('max_id'))
+    .group_by(_user_amounts.c.amount)
+    .subquery('subquery')
+)
+USER_POPULAR_AMOUNTS = select(_popular_amounts.c.amount).order_by(desc(_popular_amounts.c.max_id)).limit(4)
+
+# Заявка и строка outbox для публикации в группу создаются одним выражением
+_new_request = (
+    insert(Request)
+    .values(
+        user_id=bindparam('user_id'),
+        request_type=bindparam('request_type'),
+        currency_from=bindparam('currency_from'),
+        money_type_from=bindparam('money_type_from'),
+        location_from=bindparam('location_from'),
+        amount=bindparam('amount'),
+        currency_to=bindparam('currency_to'),
+        money_type_to=bindparam('money_type_to'),
+        location_to=bindparam('location_to'),
+        comment=bindparam('comment'),
+        message_text=bindparam('message_text'),
+        status='ACTIVE',
+        expires_at=func.now() + bindparam('ttl', type_=Interval))
+    .returning(Request.id, Request.created_at)
+    .cte('new_request')
+)
+_new_outbox = (
+    insert(GroupOutbox)
+    .from_select(['request_id', 'text'], select(_new_request.c.id, bindparam('group_text', type_=Text)))
+    .cte('new_outbox')
+)
+# id и created_at, выставленный базой, — для книги заявок и сортировки дашборда
+CREATE_REQUEST_WITH_OUTBOX = select(_new_request.c.id, _new_request.c.created_at).add_cte(_new_outbox)
+
+# Забираем пачку готовых к отправке строк; next_attempt_at сразу сдвигается с
+# экспоненциальной задержкой, так что при сбое строка вернется позже сама,
+# а другие инстансы ее не возьмут (SKIP LOCKED). Строки заявок, которые успели
+# закрыть или просрочить до публикации, удаляются без отправки
+CLAIM_OUTBOX_BATCH = text("""
+    WITH dropped AS (
+        DELETE FROM group_outbox o
+        USING requests r
+        WHERE r.id = o.request_id AND r.status <> 'ACTIVE'
+    )
+    UPDATE group_outbox
+    SET attempts = attempts + 1,
+        next_attempt_at = now() + make_interval(secs => least(power(2, attempts + 1), 300))
+    WHERE id IN (
+        SELECT o.id FROM group_outbox o
+        JOIN requests r ON r.id = o.request_id
+        WHERE o.next_attempt_at <= now() AND r.status = 'ACTIVE'
+        ORDER BY o.id
+        LIMIT :limit
+        FOR UPDATE OF o SKIP LOCKED
+    )
+    RETURNING id, request_id, text, attempts
+""")
+
+# message_id всей пачки пишутся одним UPDATE по двум массивам (unnest).
+# RETURNING отдает статус заявки после записи: если ее закрыли, пока сообщение
+# уходило в группу, публикатор сам зачеркнет его. Закрытие и запись message_id
+# сериализуются блокировкой строки, так что вторая из них видит результат первой
+SET_GROUP_MESSAGE_IDS = text("""
+    UPDATE requests r
+    SET group_message_id = v.message_id
+    FROM unnest(CAST(:request_ids AS integer[]), CAST(:message_ids AS bigint[])) AS v(request_id, message_id),
+         users u
+    WHERE r.id = v.request_id AND u.telegram_id = r.user_id
+    RETURNING r.id, r.status, r.message_text, r.comment, r.group_message_id, u.username, u.first_name
+""")
+
+_requests = Request.__table__
+_users = User.__table__
+
+DELETE_OUTBOX_ROWS = delete(GroupOutbox).where(GroupOutbox.id.in_(bindparam('ids', expanding=True)))
+
+# Закрытые заявки, сообщения которых в группе еще не зачеркнуты (очередь
+# правок в памяти теряется при перезапуске, а эта выборка — нет)
+PENDING_GROUP_EDITS = (
+    select(_requests.c.id, _requests.c.status, _requests.c.message_text, _requests.c.comment,
+           _requests.c.group_message_id, _users.c.username, _users.c.first_name)
+    .join(_users, _users.c.telegram_id == _requests.c.user_id)
+    # Условие буквально совпадает с предикатом ix_requests_group_edit_pending
+    .where(text("requests.status <> 'ACTIVE' AND requests.group_message_id IS NOT NULL "
+                "AND requests.group_closed_at IS NULL"))
+    .order_by(_requests.c.id)
+)
+MARK_GROUP_EDITED = (
+    update(_requests)
+    .where(_requests.c.id == bindparam('request_id'))
+    .values(group_closed_at=func.now())
+)
+
+# Закрытие заявки автором; RETURNING — данные для зачеркивания сообщения в группе
+CLOSE_REQUEST = (
+    update(_requests)
+    .where(_requests.c.id == bindparam('request_id'),
+           _requests.c.user_id == bindparam('user_id'),
+           _requests.c.status == 'ACTIVE',
+           _users.c.telegram_id == _requests.c.user_id)
+    .values(status='CLOSED', closed_at=func.now())
+    .returning(_requests.c.id, _requests.c.message_text, _requests.c.comment, _requests.c.group_message_id,
+               _users.c.username, _users.c.first_name)
+)
+
+# Все просроченные заявки закрываются одним выражением; RETURNING сразу отдает
+# то, что нужно для зачеркивания сообщения в группе, включая данные автора
+EXPIRE_DUE_REQUESTS = (
+    update(_requests)
+    .where(_requests.c.status == 'ACTIVE',
+           _requests.c.expires_at <= func.now(),
+           _users.c.telegram_id == _requests.c.user_id)
+    .values(status='EXPIRED', closed_at=func.now())
+    .returning(_requests.c.id, _requests.c.message_text, _requests.c.comment, _requests.c.group_message_id,
+               _users.c.username, _users.c.first_name)
+)
+
+# Продление считается от большего из текущего срока и now(), так что заранее
+# продленная заявка не теряет оставшееся время
+EXTEND_REQUEST = (
+    update(_requests)
+    .where(_requests.c.id == bindparam('request_id'),
+           _requests.c.user_id == bindparam('user_id'),
+           _requests.c.status == 'ACTIVE')
+    .values(expires_at=func.greatest(_requests.c.expires_at, func.now()) + bindparam('ttl', type_=Interval))
+    .returning(_requests.c.expires_at)
+)
+
+# Регистрация или обновление профиля пользователя. Строка переписывается только
+# если данные действительно изменились — лишних мертвых версий строк не плодим.
+# Недоступный пользователь, написавший боту, снова получает рассылки
+_upsert_user = pg_insert(_users).values(
+    telegram_id=bindparam('telegram_id'),
+    username=bindparam('username'),
+    first_name=bindparam('first_name'))
+UPSERT_USER = _upsert_user.on_conflict_do_update(
+    index_elements=[_users.c.telegram_id],
+    set_={'username': _upsert_user.excluded.username, 'first_name': _upsert_user.excluded.first_name,
+          'failed_deliveries': 0, 'is_blocked': False},
+    where=(_users.c.username.is_distinct_from(_upsert_user.excluded.username)
+           | _users.c.first_name.is_distinct_from(_upsert_user.excluded.first_name)
+           | _users.c.is_blocked)
+).returning(_users.c.telegram_id)
+
+# Итоги доставки пачкой: одно выражение на все id
+RECORD_DELIVERED = (
+    update(_users)
+    .where(_users.c.telegram_id.in_(bindparam('ids', expanding=True)))
+    .values(last_delivered_at=func.now(), failed_deliveries=0)
+)
+# Пользователь блокируется сразу (blocked=True, бот заблокирован или аккаунт
+# удален) или после max_failures неудач подряд
+RECORD_FAILED_DELIVERY = (
+    update(_users)
+    .where(_users.c.telegram_id.in_(bindparam('ids', expanding=True)))
+    .values(failed_deliveries=_users.c.failed_deliveries + 1,
+            is_blocked=_users.c.is_blocked
+            | bindparam('blocked', type_=Boolean)
+            | (_users.c.failed_deliveries + 1 >= bindparam('max_failures')))
+    .returning(_users.c.telegram_id, _users.c.is_blocked)
+)
+
+# Получатели рассылки страницами по возрастанию telegram_id, только доступные
+# (keyset по частичному индексу ix_users_reachable)
+BROADCAST_RECIPIENTS_PAGE = (
+    select(User.telegram_id)
+    .where(User.telegram_id > bindparam('cursor'), ~User.is_blocked)
+    .order_by(User.telegram_id)
+    .limit(bindparam('limit'))
+)
+COUNT_BROADCAST_RECIPIENTS = select(func.count()).select_from(User).where(~User.is_blocked)
+
+_jobs = BroadcastJob.__table__
+CHECKPOINT_BROADCAST = (
+    update(_jobs)
+    .where(_jobs.c.id == bindparam('b_job_id'))
+    .values(cursor=bindparam('b_cursor'),
+            sent=_jobs.c.sent + bindparam('b_sent'),
+            failed=_jobs.c.failed + bindparam('b_failed'))
+)
@@ -1,14 +1,12 @@
-import asyncio
 from aiogram import Router, F, types, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
 
 from config import ADMIN_ID
-from db.database import async_session_factory
-from db.models import User
+from db.database import get_all_pool_stats
 from .fsm import AdminBroadcast
 from keyboards.inline import get_confirm_kb
+from utils.broadcaster import broadcaster
 
 admin_router = Router()
 
@@ -46,38 +44,19 @@ async def get_broadcast_message(message: types.Message, state: FSMContext):
 @admin_router.callback_query(F.data == "req_confirm", AdminBroadcast.confirm, F.from_user.id == ADMIN_ID)
 async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
     data = await state.get_data()
-    text_to_send = data['message_text']
-
-    await callback.message.edit_text("⏳ Начинаю рассылку...")
-
-    async with async_session_factory() as session:
-        result = await session.execute(select(User.telegram_id))
-        user_ids = result.scalars().all()
-
-    sent_count = 0
-    failed_count = 0
-
-    for user_id in user_ids:
-        try:
-            await bot.send_message(
-                chat_id=user_id,
-                text=text_to_send,
-                parse_mode="HTML",
-                disable_notification=False
-            )
-            sent_count += 1
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            failed_count += 1
-            print(f"Failed to send message to {user_id}: {e}")
-
-    await callback.message.answer(
-        f"✅ Рассылка завершена!\n\n"
-        f"Успешно отправлено: {sent_count}\n"
-        f"Не удалось отправить: {failed_count}"
-    )
+
+    # Рассылка идет в фоне заданием broadcaster, прогресс обновляется в этом сообщении
+    try:
+        job_id = await broadcaster.submit(
+            bot, data['message_text'], callback.message.chat.id, callback.message.message_id)
+    except Exception as e:
+        print(f"Failed to start broadcast: {e}")
+        # Черновик и кнопки подтверждения остаются — можно нажать еще раз
+        return await callback.answer("❗️Не удалось запустить рассылку, попробуйте еще раз.", show_alert=True)
+
     await state.clear()
-    await callback.answer()
+    await callback.answer(f"Рассылка #{job_id} запущена")
+    await callback.message.edit_text(f"⏳ Рассылка #{job_id} запущена...")
 
 
 @admin_router.callback_query(F.data == "req_cancel", AdminBroadcast.confirm, F.from_user.id == ADMIN_ID)
@@ -85,3 +64,30 @@ async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.edit_text("Рассылка отменена.")
     await callback.answer()
+
+
+@admin_router.message(Command("resume_broadcast"), F.from_user.id == ADMIN_ID)
+async def resume_broadcast(message: types.Message, command: CommandObject, bot: Bot):
+    if not command.args or not command.args.strip().isdigit():
+        return await message.answer("Укажите номер рассылки: /resume_broadcast 12")
+    job_id = int(command.args.strip())
+    if await broadcaster.resume(bot, job_id):
+        await message.answer(f"Рассылка #{job_id} продолжена, прогресс — в ее исходном сообщении.")
+    else:
+        await message.answer(f"Рассылка #{job_id} не найдена или не остановлена.")
+
+
+@admin_router.message(Command("pool_stats"), F.from_user.id == ADMIN_ID)
+async def show_pool_stats(message: types.Message):
+    sections = []
+    for label, stats in get_all_pool_stats().items():
+        sections.append(
+            f"<b>Пул соединений: {label}</b>\n\n"
+            f"Размер пула: {stats['size']}\n"
+            f"Занято: {stats['checked_out']}\n"
+            f"Свободно: {stats['checked_in']}\n"
+            f"Overflow: {stats['overflow']} из {stats['max_overflow']}\n\n"
+            f"Выдано соединений: {stats['checkouts']}\n"
+            f"Таймаутов ожидания: {stats['timeouts']}\n"
+            f"Ожидание: среднее {stats['avg_wait_ms']:.1f} мс, максимум {stats['max_wait_ms']:.1f} мс")
+    await message.answer("\n\n".join(sections), parse_mode="HTML")
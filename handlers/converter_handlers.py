@@ -1,52 +1,16 @@
-import requests
+from datetime import timedelta
+
 from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 
 from .fsm import CurrencyConverter
 from keyboards.inline import get_converter_currency_kb, get_converter_menu_kb
+from utils.rate_poller import get_current_rates, get_current_matrix, get_rates_ago
 
 converter_router = Router()
 
 
-def get_alif_rates_new():
-    url = "https://alif.tj/api/rates"
-    try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        rates = {}
-        if "localRates" in data:
-            for currency_data in data["localRates"]:
-                name = currency_data.get("name")
-                if name in ["USD", "RUB", "EUR", "UZS", "KZT"]:
-                    rates[name] = {
-                        "buy": float(currency_data.get("buyValue", 0)),
-                        "sell": float(currency_data.get("sellValue", 0)),
-                    }
-        rates['TJS'] = {'buy': 1.0, 'sell': 1.0}
-        return rates
-    except Exception as e:
-        print(f"Could not get new Alif rates: {e}")
-        return None
-
-
-def calculate_cross_conversion(amount, from_curr, to_curr, rates):
-    if not rates or from_curr not in rates or to_curr not in rates:
-        return None, None
-
-    if from_curr == to_curr:
-        return amount, 1.0
-
-    amount_in_tjs = amount * rates[from_curr]['buy']
-
-    result_amount = amount_in_tjs / rates[to_curr]['sell']
-
-    direct_rate = rates[from_curr]['buy'] / rates[to_curr]['sell']
-
-    return round(result_amount, 2), round(direct_rate, 4)
-
-
 @converter_router.callback_query(F.data == "conv_menu_open_converter")
 async def convert_start(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
@@ -85,16 +49,26 @@ async def show_converter_menu(message: types.Message):
 async def show_all_rates(callback: types.CallbackQuery):
     await callback.message.edit_text("⏳ Получаю актуальные курсы от Алиф Банка...")
 
-    all_rates = get_alif_rates_new()
+    all_rates = await get_current_rates()
 
     if all_rates:
+        try:
+            day_ago_rates = await get_rates_ago(timedelta(hours=24))
+        except Exception as e:
+            print(f"Could not load rate history: {e}")
+            day_ago_rates = {}
+
         text = "<b>Курсы валют Алиф Банка (относительно TJS)</b>\n\n"
         for curr in ["USD", "EUR", "RUB", "UZS", "KZT"]:
             if curr in all_rates:
                 rate = all_rates[curr]
                 text += f"<b>{curr}:</b>\n"
                 text += f"  Покупка: <code>{rate['buy']}</code>\n"
-                text += f"  Продажа: <code>{rate['sell']}</code>\n\n"
+                text += f"  Продажа: <code>{rate['sell']}</code>\n"
+                if curr in day_ago_rates:
+                    change = rate['buy'] - day_ago_rates[curr]['buy']
+                    text += f"  За 24ч: <code>{change:+.4f}</code>\n"
+                text += "\n"
 
         await callback.message.edit_text(text, parse_mode="HTML")
     else:
@@ -133,9 +107,9 @@ async def process_amount_and_calculate(message: types.Message, state: FSMContext
 
     await message.answer("⏳ Считаю курс по данным Алиф Банка...")
 
-    all_rates = get_alif_rates_new()
+    rate_matrix = await get_current_matrix()
 
-    result_amount, direct_rate = calculate_cross_conversion(amount, from_curr, to_curr, all_rates)
+    result_amount, direct_rate = (None, None) if rate_matrix is None else rate_matrix.convert(amount, from_curr, to_curr)
 
     if result_amount is not None:
         await message.answer(
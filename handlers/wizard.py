@@ -0,0 +1,139 @@
+from aiogram.fsm.state import State
+
+from handlers.fsm import CreateRequest
+from keyboards import inline
+
+# Справочники мастера CreateRequest: ключ уходит в базу, подпись — в текст заявки.
+# Новая валюта или город — это новая строка здесь, обработчики менять не нужно
+REQUEST_TYPES = {'take': 'Мне нужны', 'give': 'Я отдам'}
+CURRENCIES_FROM = {'USD': 'долларов', 'TJS': 'сомони', 'UZS': 'сумов', 'RUB': 'рублей'}
+CURRENCIES_TO = {'USD': 'доллары', 'TJS': 'сомони', 'UZS': 'сумы', 'RUB': 'рубли'}
+CURRENCY_SYMBOLS = {'USD': '$', 'RUB': '₽', 'TJS': 'смн', 'UZS': 'сум'}
+MONEY_TYPES_FROM = {'cash': 'наличных', 'online': 'безналичных'}
+# Подписи второй половины зависят от типа заявки
+MONEY_TYPES_TO = {
+    'take': {'cash': 'отдам наличные', 'online': 'отдам безналичные'},
+    'give': {'cash': 'нужны наличные', 'online': 'нужны безналичные'},
+}
+LOCATIONS = {'dushanbe': 'в Душанбе', 'tashkent': 'в Ташкенте', 'moscow': 'в Москве'}
+DEFAULT_AMOUNTS = (100, 500, 1000, 5000)
+# Безнал в национальной валюте — всегда в ее городе, шаг выбора города пропускается
+ONLINE_CITIES = {'TJS': 'dushanbe', 'UZS': 'tashkent', 'RUB': 'moscow'}
+
+
+def online_city(side: str):
+    def rule(data: dict):
+        if data.get(f"money_type_{side}_key") == 'online':
+            return ONLINE_CITIES.get(data.get(f"currency_{side}_key"))
+        return None
+    return rule
+
+
+class Step:
+    # Один шаг мастера. У шагов с вариантами (options) выбор сохраняется как
+    # <name>_key и <name>_value, кнопки и подписи собираются один раз здесь.
+    # auto(data) возвращает ключ варианта, если шаг заполняется сам и не показывается;
+    # revisit=False — на шаг не возвращаются кнопкой «Назад»
+    def __init__(self, state: State, keys=None, options: dict = None, options_by: str = None,
+                 prompt: str = None, suffix: str = "...", columns: int = 1, auto=None, revisit: bool = True):
+        self.state = state
+        self.name = state.state.split(':', 1)[1]
+        self.options_by = options_by
+        self.variants = options if options_by else ({None: options} if options else {})
+        self.keys = tuple(keys) if keys is not None else (f"{self.name}_key", f"{self.name}_value")
+        self.prompt = prompt
+        self.columns = columns
+        self.auto = auto
+        self.revisit = revisit
+        self.buttons = {variant: tuple((key, f"{label}{suffix}") for key, label in labels.items())
+                        for variant, labels in self.variants.items()}
+
+    @property
+    def is_choice(self):
+        return bool(self.variants)
+
+    def variant(self, data: dict):
+        return data.get(self.options_by) if self.options_by else None
+
+    def options_for(self, data: dict):
+        return self.variants.get(self.variant(data), {})
+
+    def buttons_for(self, data: dict):
+        return self.buttons.get(self.variant(data), ())
+
+    def choose(self, data: dict, key: str):
+        label = self.options_for(data).get(key)
+        if label is None:
+            return False
+        data[f"{self.name}_key"] = key
+        data[f"{self.name}_value"] = label
+        return True
+
+
+STEPS = [
+    Step(CreateRequest.request_type, options=REQUEST_TYPES, prompt="Выберите необходимое действие:", columns=2),
+    Step(CreateRequest.amount, keys=['amount']),
+    Step(CreateRequest.currency_from, options=CURRENCIES_FROM, columns=4),
+    Step(CreateRequest.money_type_from, options=MONEY_TYPES_FROM, columns=2),
+    Step(CreateRequest.location_from, options=LOCATIONS, auto=online_city('from')),
+    Step(CreateRequest.money_type_to, options=MONEY_TYPES_TO, options_by='request_type_key', columns=2),
+    Step(CreateRequest.currency_to, options=CURRENCIES_TO, columns=4),
+    Step(CreateRequest.location_to, options=LOCATIONS, suffix="", auto=online_city('to')),
+    Step(CreateRequest.show_matches, keys=[], revisit=False),
+    Step(CreateRequest.confirm, keys=['final_message_text', 'comment']),
+]
+STEPS_BY_NAME = {step.name: step for step in STEPS}
+ORDERED_STATES = [step.state for step in STEPS]
+STEPS_KEYS = {step.state: list(step.keys) for step in STEPS}
+
+
+def step_index(step: Step):
+    return STEPS.index(step)
+
+
+def next_step(step: Step, data: dict):
+    # Следующий показываемый шаг; шаги с auto-правилом заполняются по пути
+    for candidate in STEPS[step_index(step) + 1:]:
+        auto_key = candidate.auto(data) if candidate.auto else None
+        if auto_key is None or not candidate.choose(data, auto_key):
+            return candidate
+    return None
+
+
+def previous_step(step: Step, data: dict):
+    for candidate in reversed(STEPS[:step_index(step)]):
+        if candidate.revisit and not (candidate.auto and candidate.auto(data)):
+            return candidate
+    return None
+
+
+def keys_from(step: Step):
+    # Данные этого шага и всех следующих — их сбрасываем при возврате назад
+    return {key for later in STEPS[step_index(step):] for key in later.keys}
+
+
+def back_targets(step: Step):
+    # Все шаги, на которые может вести «Назад» с этого шага, с учетом auto-правил
+    targets = []
+    for candidate in reversed(STEPS[:step_index(step)]):
+        if not candidate.revisit:
+            continue
+        targets.append(candidate.name)
+        if candidate.auto is None:
+            break
+    return targets or [None]
+
+
+def warm_keyboards():
+    # Собирает клавиатуры всех шагов заранее, чтобы первый клик не платил за сборку
+    for step in STEPS:
+        for back in back_targets(step):
+            for buttons in step.buttons.values():
+                inline.get_choice_kb(step.name, buttons, step.columns, back_to=back)
+    for back in back_targets(STEPS_BY_NAME['amount']):
+        inline.get_amount_kb(DEFAULT_AMOUNTS, back_to=back)
+    for back in back_targets(STEPS_BY_NAME['show_matches']):
+        inline.get_show_matches_kb(back_to=back)
+    for back in back_targets(STEPS_BY_NAME['confirm']):
+        inline.get_confirm_kb(back_to=back)
+    inline.get_comment_kb(back_to=STEPS_BY_NAME['confirm'].name)
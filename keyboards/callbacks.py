@@ -0,0 +1,15 @@
+from aiogram.filters.callback_data import CallbackData
+
+
+class ChoiceCallback(CallbackData, prefix="choice"):
+    # Выбор варианта на шаге мастера: step — имя шага, key — ключ варианта
+    step: str
+    key: str
+
+
+class AmountCallback(CallbackData, prefix="amount"):
+    value: int
+
+
+class BackCallback(CallbackData, prefix="back"):
+    step: str
@@ -1,153 +1,109 @@
-from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
-
-
-def get_request_type_kb():
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="Мне нужны...", callback_data="request_type_take"),
-        InlineKeyboardButton(text="Я отдам...", callback_data="request_type_give"))
-    return builder.as_markup()
-
-
-def get_amount_kb(amounts, back_to_state: str = None):
-    builder = InlineKeyboardBuilder()
-
-    if amounts:
-        for amount in amounts:
-            builder.add(InlineKeyboardButton(text=str(amount), callback_data=f"amount_{amount}"))
-        builder.adjust(4)
+from functools import lru_cache, wraps
 
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
-
-
-def get_currency_from_kb(back_to_state: str = None, exclude_currency=None):
-    currencies = {
-        "долларов...": "currency_from_USD",
-        "сомони...": "currency_from_TJS",
-        "сумов...": "currency_from_UZS",
-        "рублей...": "currency_from_RUB"
-    }
-
-    builder = InlineKeyboardBuilder()
-    for text, callback_data in currencies.items():
-        if exclude_currency != callback_data.split('_')[1]:
-            builder.add(InlineKeyboardButton(text=text, callback_data=callback_data))
-    builder.adjust(4)
-
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
-
-
-def get_money_type_from_kb(back_to_state: str = None):
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text="наличных...", callback_data="money_type_from_cash"),
-                InlineKeyboardButton(text="безналичных...", callback_data="money_type_from_online"))
-
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
-
-
-def get_location_from_kb(back_to_state: str = None):
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="в Душанбе...", callback_data="location_dushanbe"),
-        InlineKeyboardButton(text="в Ташкенте...", callback_data="location_tashkent"),
-        InlineKeyboardButton(text="в Москве...", callback_data="location_moscow"))
-    builder.adjust(1)
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
+from config import KEYBOARD_CACHE_SIZE
+from keyboards.callbacks import ChoiceCallback, AmountCallback, BackCallback
 
 
-def get_money_type_take_to_kb(back_to_state: str = None):
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text="отдам наличные...", callback_data="money_type_to_cash"),
-                InlineKeyboardButton(text="отдам безналичные...", callback_data="money_type_to_online"))
+def cached_keyboard(maxsize: int = None):
+    # Клавиатура зависит только от аргументов, поэтому собирается через
+    # InlineKeyboardBuilder один раз. Разметка aiogram изменяема, так что в кэше
+    # лежат кортежи рядов, а каждый вызов получает свою разметку с копиями
+    # кнопок — правка одной клавиатуры не портит ее остальным пользователям.
+    # Кэш экономит время сборки (валидацию и упаковку callback_data), но не
+    # память: копии выделяются на каждый вызов почти в том же объеме.
+    # Аргументы должны быть хешируемыми (кортежи вместо списков)
+    def decorator(build):
+        @lru_cache(maxsize=maxsize)
+        def rows(*args, **kwargs):
+            return tuple(tuple(row) for row in build(*args, **kwargs).inline_keyboard)
 
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
+        @wraps(build)
+        def wrapper(*args, **kwargs):
+            return InlineKeyboardMarkup(
+                inline_keyboard=[[button.model_copy() for button in row] for row in rows(*args, **kwargs)])
 
+        wrapper.cache_info = rows.cache_info
+        wrapper.cache_clear = rows.cache_clear
+        return wrapper
+    return decorator
 
-def get_currency_to_kb(back_to_state: str = None, exclude_currency=None):
-    currencies = {
-        "доллары...": "currency_to_USD",
-        "сомони...": "currency_to_TJS",
-        "сумы...": "currency_to_UZS",
-        "рубли...": "currency_to_RUB"
-    }
 
+@cached_keyboard()
+def get_choice_kb(step: str, buttons, columns: int = 1, back_to: str = None):
     builder = InlineKeyboardBuilder()
-    for text, callback_data in currencies.items():
-        if exclude_currency != callback_data.split('_')[1]:
-            builder.add(InlineKeyboardButton(text=text, callback_data=callback_data))
-    builder.adjust(4)
+    for key, text in buttons:
+        builder.add(InlineKeyboardButton(text=text, callback_data=ChoiceCallback(step=step, key=key).pack()))
+    builder.adjust(columns)
 
-    add_back_button(builder, back_to_state)
+    add_back_button(builder, back_to)
     return builder.as_markup()
 
 
-def get_location_to_kb(back_to_state: str = None):
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
+def get_amount_kb(amounts: tuple, back_to: str = None):
     builder = InlineKeyboardBuilder()
-    builder.row(
-        InlineKeyboardButton(text="в Душанбе", callback_data="location_dushanbe"),
-        InlineKeyboardButton(text="в Ташкенте", callback_data="location_tashkent"),
-        InlineKeyboardButton(text="в Москве", callback_data="location_moscow"))
-    builder.adjust(1)
 
-    add_back_button(builder, back_to_state)
-    return builder.as_markup()
-
-
-def get_money_type_give_to_kb(back_to_state: str = None):
-    builder = InlineKeyboardBuilder()
-    builder.row(InlineKeyboardButton(text="нужны наличные...", callback_data="money_type_to_cash"),
-                InlineKeyboardButton(text="нужны безналичные...", callback_data="money_type_to_online"))
+    if amounts:
+        for amount in amounts:
+            builder.add(InlineKeyboardButton(text=str(amount), callback_data=AmountCallback(value=amount).pack()))
+        builder.adjust(4)
 
-    add_back_button(builder, back_to_state)
+    add_back_button(builder, back_to)
     return builder.as_markup()
 
 
-def get_show_matches_kb(back_to_state: str = None):
+@cached_keyboard()
+def get_show_matches_kb(back_to: str = None):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="✅ Да", callback_data="proceed_to_confirm"))
 
     builder.add(InlineKeyboardButton(text="❌ Нет", callback_data="req_cancel"))
-    if back_to_state:
-        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"back_to_{back_to_state}"))
+    add_back_button(builder, back_to)
     return builder.as_markup()
 
 
-def get_confirm_kb(back_to_state: str = None):
+@cached_keyboard()
+def get_confirm_kb(back_to: str = None):
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="✅ Подтвердить", callback_data="req_confirm"))
     builder.row(InlineKeyboardButton(text="💬 Добавить комментарий", callback_data="req_add_comment"))
     builder.add(InlineKeyboardButton(text="❌ Отменить", callback_data="req_cancel"))
 
-    add_back_button(builder, back_to_state)
+    add_back_button(builder, back_to)
     return builder.as_markup()
 
 
-def get_comment_kb(back_to_state: str = None):
+@cached_keyboard()
+def get_comment_kb(back_to: str = None):
     builder = InlineKeyboardBuilder()
-    add_back_button(builder, back_to_state)
+    add_back_button(builder, back_to)
     return builder.as_markup()
 
 
-def get_my_requests_kb(requests):
+# Ключ — кортеж id активных заявок пользователя: повторный /my без изменений
+# попадает в кэш, вытеснение LRU ограничивает число разовых клавиатур
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
+def get_my_requests_kb(request_ids: tuple):
     builder = InlineKeyboardBuilder()
-    if not requests:
+    if not request_ids:
         return builder.as_markup()
 
-    for req in requests:
+    for request_id in request_ids:
         builder.row(
             InlineKeyboardButton(
-                text=f"❌ Закрыть заявку #{req.id}",
-                callback_data=f"close_req_{req.id}"))
+                text=f"❌ Закрыть заявку #{request_id}",
+                callback_data=f"close_req_{request_id}"),
+            InlineKeyboardButton(
+                text=f"⏳ Продлить #{request_id}",
+                callback_data=f"extend_req_{request_id}"))
 
     return builder.as_markup()
 
 
+@cached_keyboard()
 def get_converter_currency_kb(exclude_callback=None):
     api_currencies = {
         "🇹🇯 TJS": "cur_TJS",
@@ -163,6 +119,7 @@ def get_converter_currency_kb(exclude_callback=None):
     return builder.as_markup()
 
 
+@cached_keyboard()
 def get_converter_menu_kb():
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="📊 Посмотреть все курсы", callback_data="conv_menu_show_all"))
@@ -170,12 +127,27 @@ def get_converter_menu_kb():
     return builder.as_markup()
 
 
+@cached_keyboard()
 def get_skip_comment_kb():
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="➡️ Пропустить", callback_data="skip_comment"))
     return builder.as_markup()
 
 
-def add_back_button(builder: InlineKeyboardBuilder, back_to_state: str):
-    if back_to_state:
-        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"back_to_{back_to_state}"))
+def add_back_button(builder: InlineKeyboardBuilder, back_to: str):
+    # back_to — имя шага мастера, см. handlers.wizard.STEPS
+    if back_to:
+        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data=BackCallback(step=back_to).pack()))
+
+
+CONVERTER_CURRENCY_CALLBACKS = ("cur_TJS", "cur_USD", "cur_UZS", "cur_RUB")
+
+
+def warm_static_keyboards():
+    # Клавиатуры вне мастера заявок; клавиатуры шагов греет handlers.wizard.warm_keyboards
+    get_converter_menu_kb()
+    get_converter_currency_kb()
+    for callback_data in CONVERTER_CURRENCY_CALLBACKS:
+        get_converter_currency_kb(exclude_callback=callback_data)
+    get_confirm_kb()
+    get_skip_comment_kb()
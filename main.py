@@ -3,7 +3,22 @@ import logging
 from aiogram import Bot, Dispatcher
 
 from config import BOT_TOKEN
-from db.database import create_tables
+from db.migrations import run_migrations
+from db.fsm_storage import SqlStorage
+from utils.rates_client import close_session
+from utils.rate_poller import run_rate_poller
+from utils.order_book import order_book
+from utils.match_notifier import match_notifier
+from utils.outbox_publisher import outbox_publisher
+from utils.request_archiver import run_request_archiver
+from utils.request_expiry import run_request_expiry
+from utils.group_edits import group_edit_queue
+from middlewares.users import UserRegistrationMiddleware
+from utils.user_registry import user_registry
+from utils.broadcaster import broadcaster
+from utils.delivery_tracker import delivery_tracker
+from handlers.wizard import warm_keyboards
+from keyboards.inline import warm_static_keyboards
 from handlers import user_commands, converter_handlers, admin_handlers,request_handlers
 
 logging.basicConfig(level=logging.INFO)
@@ -11,9 +26,17 @@ logging.basicConfig(level=logging.INFO)
 
 async def main():
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
 
-    await create_tables()
+    await run_migrations()
+    storage = SqlStorage.from_url()
+    await storage.start()
+    dp = Dispatcher(storage=storage)
+
+    await order_book.load()
+    warm_keyboards()
+    warm_static_keyboards()
+
+    dp.update.outer_middleware(UserRegistrationMiddleware(user_registry))
 
     dp.include_router(admin_handlers.admin_router)
     dp.include_router(user_commands.router)
@@ -22,8 +45,33 @@ async def main():
 
     print("Starting bot...")
 
+    rate_poller_task = asyncio.create_task(run_rate_poller())
+    archiver_task = asyncio.create_task(run_request_archiver())
+    expiry_task = asyncio.create_task(run_request_expiry(bot))
+    match_notifier.start(bot)
+    outbox_publisher.start(bot)
+    await group_edit_queue.start(bot)
+    user_registry.start()
+    delivery_tracker.start()
+    await broadcaster.start(bot)
+
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        rate_poller_task.cancel()
+        archiver_task.cancel()
+        expiry_task.cancel()
+        match_notifier.stop()
+        outbox_publisher.stop()
+        group_edit_queue.stop()
+        user_registry.stop()
+        delivery_tracker.stop()
+        await broadcaster.stop()
+        await user_registry.flush()
+        await delivery_tracker.flush()
+        await storage.close()
+        await close_session()
 
 
 if __name__ == "__main__":
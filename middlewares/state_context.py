@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import TelegramObject
+
+
+class StateContext:
+    # Состояние и данные FSM на время одного апдейта. Обработчик меняет их
+    # в памяти, а в хранилище изменения уходят один раз — в commit() после
+    # успешного завершения обработчика
+    def __init__(self, fsm: FSMContext, state: Optional[str], data: Dict[str, Any]):
+        self.fsm = fsm
+        self.state = state
+        self.data = data
+        self._saved_state = state
+        self._saved_data = dict(data)
+
+    def update(self, **kwargs):
+        self.data.update(kwargs)
+
+    def set_state(self, state=None):
+        self.state = state.state if isinstance(state, State) else state
+
+    def clear(self):
+        self.state = None
+        self.data = {}
+
+    async def commit(self):
+        if self.data != self._saved_data:
+            await self.fsm.set_data(self.data)
+            self._saved_data = dict(self.data)
+        if self.state != self._saved_state:
+            await self.fsm.set_state(self.state)
+            self._saved_state = self.state
+
+
+class StateContextMiddleware(BaseMiddleware):
+    # Внутренний middleware роутера: данные FSM читаются один раз перед
+    # обработчиком и передаются ему как ctx. Состояние уже прочитано
+    # FSMContextMiddleware для фильтров — берем его из raw_state
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        fsm: FSMContext = data.get("state")
+        if fsm is None:
+            return await handler(event, data)
+        ctx = StateContext(fsm, data.get("raw_state"), await fsm.get_data())
+        data["ctx"] = ctx
+        # Если обработчик упал, правки не сохраняются: FSM остается таким,
+        # каким был до апдейта, а не наполовину измененным
+        result = await handler(event, data)
+        await ctx.commit()
+        return result
@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.enums import ChatType
+from aiogram.types import Chat, TelegramObject, User
+
+from utils.user_registry import UserRegistry, user_registry
+
+
+class UserRegistrationMiddleware(BaseMiddleware):
+    # Регистрирует каждого, кто пишет боту в личку, а не только нажавших /start.
+    # Участники группы, нажавшие кнопку дашборда, пользователями не считаются.
+    # Вешается на dp.update после встроенного UserContextMiddleware
+    def __init__(self, registry: UserRegistry = user_registry):
+        self.registry = registry
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user: User = data.get("event_from_user")
+        chat: Chat = data.get("event_chat")
+        if user is not None and not user.is_bot and chat is not None and chat.type == ChatType.PRIVATE:
+            await self.registry.touch(user.id, user.username, user.first_name)
+        return await handler(event, data)
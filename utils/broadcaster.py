@@ -0,0 +1,240 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from sqlalchemy import select, update, func
+
+from config import (BROADCAST_RATE_PER_SEC, BROADCAST_CONCURRENCY, BROADCAST_PAGE_SIZE, BROADCAST_PROGRESS_INTERVAL,
+                    BROADCAST_MAX_RETRIES)
+from db.database import async_session_factory, read_session
+from db.models import BroadcastJob
+from db.queries import BROADCAST_RECIPIENTS_PAGE, COUNT_BROADCAST_RECIPIENTS, CHECKPOINT_BROADCAST
+from utils.delivery_tracker import delivery_tracker
+
+SEND_ATTEMPTS = 3
+# Пауза перед повтором задания после сбоя: 5, 10, 20... секунд, не больше 5 минут
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 300
+
+
+class TokenBucket:
+    # rate токенов в секунду, не больше capacity подряд. После RetryAfter
+    # выдача останавливается для всех отправителей сразу
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def render_progress(job: BroadcastJob, status: str = 'RUNNING'):
+    titles = {
+        'RUNNING': f"⏳ Рассылка #{job.id} идет...",
+        'DONE': f"✅ Рассылка #{job.id} завершена!",
+        'FAILED': f"❗️Рассылка #{job.id} остановлена из-за ошибки. Продолжить: /resume_broadcast {job.id}",
+    }
+    return (f"{titles[status]}\n\n"
+            f"Обработано: {job.sent + job.failed} из {job.total}\n"
+            f"Успешно отправлено: {job.sent}\n"
+            f"Не удалось отправить: {job.failed}")
+
+
+class Broadcaster:
+    # Рассылки как задания в broadcast_jobs. Получатели идут страницами по
+    # telegram_id, внутри страницы — не более concurrency параллельных отправок
+    # через общий token bucket. После каждой страницы курсор пишется в базу,
+    # поэтому после падения рассылка продолжается со следующей страницы
+    # (страница, на которой упали, может уйти части получателей повторно).
+    # Сбой внутри задания (база, запрос страницы) повторяется с паузой; после
+    # max_retries попыток задание помечается FAILED, и админ продолжает его сам
+    def __init__(self, rate_per_sec: float = BROADCAST_RATE_PER_SEC, concurrency: int = BROADCAST_CONCURRENCY,
+                 page_size: int = BROADCAST_PAGE_SIZE, progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+                 max_retries: int = BROADCAST_MAX_RETRIES):
+        self.rate_per_sec = rate_per_sec
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.bucket = None
+        self.tasks = {}
+        # Последнее известное состояние заданий — для отчета, когда база недоступна
+        self.jobs = {}
+
+    async def start(self, bot: Bot):
+        # Bucket создается внутри работающего цикла событий
+        self.bucket = TokenBucket(self.rate_per_sec)
+        async with async_session_factory() as session:
+            result = await session.execute(select(BroadcastJob.id).where(BroadcastJob.status == 'RUNNING'))
+            job_ids = result.scalars().all()
+        for job_id in job_ids:
+            print(f"Resuming broadcast #{job_id}")
+            self._spawn(bot, job_id)
+
+    async def stop(self):
+        # Дожидаемся отмены, чтобы задания не обращались к базе после закрытия движка
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = {}
+
+    async def resume(self, bot: Bot, job_id: int):
+        # Возвращает в работу остановленное задание; False — если такого нет или оно уже идет.
+        # RUNNING без задачи — это задание, которое не удалось пометить FAILED
+        if job_id in self.tasks:
+            return False
+        async with async_session_factory() as session:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(('FAILED', 'RUNNING')))
+                .values(status='RUNNING')
+                .returning(BroadcastJob.id))
+            resumed = result.scalar_one_or_none()
+            await session.commit()
+        if resumed is None:
+            return False
+        self._spawn(bot, job_id)
+        return True
+
+    async def submit(self, bot: Bot, text: str, admin_chat_id: int, progress_message_id: int):
+        async with read_session() as session:
+            total = (await session.execute(COUNT_BROADCAST_RECIPIENTS)).scalar_one()
+        async with async_session_factory() as session:
+            job = BroadcastJob(text=text, total=total, admin_chat_id=admin_chat_id,
+                               progress_message_id=progress_message_id)
+            session.add(job)
+            await session.commit()
+        self._spawn(bot, job.id)
+        return job.id
+
+    def _spawn(self, bot: Bot, job_id: int):
+        task = asyncio.create_task(self._run_job(bot, job_id))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    async def _run_job(self, bot: Bot, job_id: int):
+        # Каждый повтор заново читает курсор из базы и продолжает с последнего чекпоинта
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.run_job(bot, job_id)
+                self.jobs.pop(job_id, None)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Broadcast #{job_id} failed after {attempt + 1} attempts: {e}")
+                    break
+                delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+                print(f"Broadcast #{job_id} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+        await self.fail(bot, job_id)
+
+    async def fail(self, bot: Bot, job_id: int):
+        try:
+            async with async_session_factory() as session:
+                await session.execute(
+                    update(BroadcastJob).where(BroadcastJob.id == job_id).values(status='FAILED'))
+                await session.commit()
+        except Exception as e:
+            # Задание останется RUNNING и продолжится при следующем запуске бота
+            print(f"Could not mark broadcast #{job_id} as failed: {e}")
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            await self.report(bot, job, status='FAILED')
+
+    async def run_job(self, bot: Bot, job_id: int):
+        async with async_session_factory() as session:
+            job = await session.get(BroadcastJob, job_id)
+        self.jobs[job_id] = job
+        last_progress = 0.0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(user_id: int):
+            async with semaphore:
+                return await self.send_one(bot, user_id, job.text)
+
+        while True:
+            async with read_session() as session:
+                result = await session.execute(
+                    BROADCAST_RECIPIENTS_PAGE, {'cursor': job.cursor, 'limit': self.page_size})
+                user_ids = result.scalars().all()
+            if not user_ids:
+                break
+
+            results = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+            page_sent = sum(results)
+            page_failed = len(results) - page_sent
+            async with async_session_factory() as session:
+                await session.execute(CHECKPOINT_BROADCAST, {
+                    'b_job_id': job_id, 'b_cursor': user_ids[-1], 'b_sent': page_sent, 'b_failed': page_failed})
+                await session.commit()
+            job.cursor, job.sent, job.failed = user_ids[-1], job.sent + page_sent, job.failed + page_failed
+            # Итоги страницы сразу в users, чтобы недоступные выпали из следующих рассылок
+            try:
+                await delivery_tracker.flush()
+            except Exception as e:
+                print(f"Failed to record delivery results of broadcast #{job_id}: {e}")
+
+            if time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                await self.report(bot, job)
+
+        async with async_session_factory() as session:
+            await session.execute(
+                update(BroadcastJob).where(BroadcastJob.id == job_id).values(status='DONE', finished_at=func.now()))
+            await session.commit()
+        await self.report(bot, job, status='DONE')
+
+    async def send_one(self, bot: Bot, user_id: int, text: str):
+        for _ in range(SEND_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(chat_id=user_id, text=text, parse_mode="HTML")
+                delivery_tracker.record(user_id)
+                return True
+            except TelegramRetryAfter as e:
+                self.bucket.pause(e.retry_after)
+            except Exception as e:
+                delivery_tracker.record(user_id, e)
+                print(f"Failed to send broadcast message to {user_id}: {e}")
+                return False
+        return False
+
+    async def report(self, bot: Bot, job: BroadcastJob, status: str = 'RUNNING'):
+        if not job.progress_message_id:
+            return
+        await self.bucket.acquire()
+        try:
+            await bot.edit_message_text(
+                text=render_progress(job, status),
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id)
+        except TelegramRetryAfter as e:
+            self.bucket.pause(e.retry_after)
+        except TelegramBadRequest:
+            pass
+
+
+broadcaster = Broadcaster()
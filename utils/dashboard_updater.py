@@ -1,12 +1,18 @@
+import asyncio
+import re
+import time
+
 from aiogram import Bot
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, delete
 from aiogram.exceptions import TelegramBadRequest
 
 from db.database import async_session_factory
-from db.models import Request
-from config import GROUP_ID, DASHBOARD_MESSAGE_ID
+from db.models import DashboardShard
+from config import GROUP_ID, DASHBOARD_MESSAGE_ID, DASHBOARD_DEBOUNCE, DASHBOARD_MIN_INTERVAL
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.order_book import order_book
+
+MESSAGE_LIMIT = 4000
 
 
 def format_number(num):
@@ -22,55 +28,278 @@ def get_dashboard_kb():
     ])
 
 
-async def update_dashboard(bot: Bot):
-    async with async_session_factory() as session:
-        query = (
-            select(Request)
-            .where(Request.status == 'ACTIVE')
-            .options(selectinload(Request.user))
-            .order_by(Request.created_at.asc())
-        )
-        result = await session.execute(query)
-        requests = result.scalars().all()
+def render_request_line(req, author_mention: str) -> str:
+    # Собираем основной текст заявки
+    line = f"— {author_mention} {req.message_text}."
+
+    if req.group_message_id and GROUP_ID:
+        chat_id_for_link = str(GROUP_ID).replace("-100", "")
+        link = f"https://t.me/c/{chat_id_for_link}/{req.group_message_id}"
+        # Добавляем в конец строки маленькую, аккуратную ссылку
+        line += f' <a href="{link}">*тык*</a>'
+
+    if req.comment:
+        line += f"\n<i>Комментарий: {req.comment}</i>"
+
+    return line
+
+
+HTML_TAG = re.compile(r"<(/?)(\w+)[^>]*>")
+
+
+def safe_cut(text: str, cut: int) -> int:
+    # Сдвигает позицию разреза назад, если она внутри тега или HTML-сущности
+    while True:
+        head = text[:cut]
+        if head.rfind("<") > head.rfind(">"):
+            cut = head.rfind("<")
+        elif head.rfind("&") > head.rfind(";"):
+            cut = head.rfind("&")
+        else:
+            return cut
 
-    if not requests:
-        text = "<b>Актуальные заявки</b>\n\nНа данный момент активных заявок нет."
-    else:
-        text_parts = ["<b>Актуальные заявки</b>"]
-        for req in requests:
-            author_mention = f"@{req.user.username}" if req.user.username else req.user.first_name
 
-            # Собираем основной текст заявки
-            line = f"— {author_mention} {req.message_text}."
+def closing_tags_for(head: str) -> str:
+    open_tags = []
+    for closing, tag in HTML_TAG.findall(head):
+        if not closing:
+            open_tags.append(tag)
+        elif tag in open_tags:
+            del open_tags[len(open_tags) - 1 - open_tags[::-1].index(tag)]
+    return "".join(f"</{tag}>" for tag in reversed(open_tags))
 
-            # --- НОВАЯ КРАСИВАЯ ЛОГИКА ---
-            if req.group_message_id and GROUP_ID:
-                chat_id_for_link = str(GROUP_ID).replace("-100", "")
-                link = f"https://t.me/c/{chat_id_for_link}/{req.group_message_id}"
-                # Добавляем в конец строки маленькую, аккуратную ссылку
-                line += f' <a href="{link}">*тык*</a>'
-            # --- КОНЕЦ НОВОЙ ЛОГИКИ ---
 
-            if req.comment:
-                line += f"\n<i>Комментарий: {req.comment}</i>"
+def truncate_html(text: str, limit: int) -> str:
+    # Обрезает HTML-строку до limit символов, не разрывая тег или сущность,
+    # и закрывает теги, оставшиеся открытыми. Место под «…» и закрывающие теги
+    # резервируется от исходного limit; разрез только сдвигается назад
+    if len(text) <= limit:
+        return text
+    cut = safe_cut(text, limit - 1)
+    while True:
+        closing_tags = closing_tags_for(text[:cut])
+        fits = limit - 1 - len(closing_tags)
+        if cut <= fits:
+            return f"{text[:cut]}…{closing_tags}"
+        cut = safe_cut(text, max(fits, 0))
 
+
+def split_into_messages(header: str, lines, limit: int = MESSAGE_LIMIT):
+    # Режем список строк на сообщения, каждое не длиннее лимита Telegram.
+    # Строка, которая одна не влезает в сообщение (длинный комментарий), обрезается
+    chunks, current, size = [], [header], len(header)
+    for line in lines:
+        line = truncate_html(line, limit - len(header) - 2)
+        if size + len(line) + 2 > limit and len(current) > 1:
+            chunks.append("\n\n".join(current))
+            current, size = [header], len(header)
+        current.append(line)
+        size += len(line) + 2
+    chunks.append("\n\n".join(current))
+    return chunks
+
+
+def get_shard_link(message_id: int) -> str:
+    chat_id_for_link = str(GROUP_ID).replace("-100", "")
+    return f"https://t.me/c/{chat_id_for_link}/{message_id}"
+
+
+class DashboardRenderer:
+    # Хранит готовый HTML-фрагмент каждой активной заявки, сгруппированный по
+    # валютной паре: создание и закрытие заявки пересобирают только шарды своей пары
+    def __init__(self):
+        self.groups = {}
+        self.request_pairs = {}
+        self.loaded = False
+        self.last_sent = {}
+        self._pair_shards = {}
+
+    def load(self):
+        # Синхронный снимок книги заявок: между ним и add/remove нет await,
+        # поэтому правки, пришедшие во время загрузки, потеряться не могут
+        self.groups, self.request_pairs, self._pair_shards = {}, {}, {}
+        self.loaded = True
+        for req in order_book.active():
+            self.add(req)
+
+    def invalidate(self):
+        self.loaded = False
+
+    def add(self, req):
+        if not self.loaded:
+            return
+        pair = (req.currency_from, req.currency_to)
+        self.groups.setdefault(pair, {})[req.id] = render_request_line(req, req.author_mention)
+        self.request_pairs[req.id] = pair
+        self._pair_shards.pop(pair, None)
+
+    def remove(self, request_id: int):
+        pair = self.request_pairs.pop(request_id, None)
+        if pair is None:
+            return
+        group = self.groups[pair]
+        del group[request_id]
+        if not group:
+            del self.groups[pair]
+        self._pair_shards.pop(pair, None)
+
+    def render_pair(self, pair):
+        if pair not in self._pair_shards:
+            header = f"<b>{pair[0]} → {pair[1]}</b>"
+            chunks = split_into_messages(header, self.groups[pair].values())
+            self._pair_shards[pair] = {f"{pair[0]}-{pair[1]}-{n}": text for n, text in enumerate(chunks)}
+        return self._pair_shards[pair]
+
+    def render_shards(self) -> dict:
+        shards = {}
+        for pair in sorted(self.groups):
+            shards.update(self.render_pair(pair))
+        return shards
+
+    def render_summary(self, shard_message_ids: dict) -> str:
+        if not self.groups:
+            return "<b>Актуальные заявки</b>\n\nНа данный момент активных заявок нет."
+        text_parts = ["<b>Актуальные заявки</b>"]
+        for pair in sorted(self.groups):
+            line = f"— {pair[0]} → {pair[1]}: {len(self.groups[pair])}"
+            message_id = shard_message_ids.get(f"{pair[0]}-{pair[1]}-0")
+            if message_id and GROUP_ID:
+                line += f' <a href="{get_shard_link(message_id)}">*тык*</a>'
             text_parts.append(line)
+        return "\n".join(text_parts)
+
 
-        text = "\n\n".join(text_parts)
+dashboard_renderer = DashboardRenderer()
+shard_message_ids = {}
 
+
+async def load_shard_message_ids():
+    async with async_session_factory() as session:
+        result = await session.execute(select(DashboardShard.shard_key, DashboardShard.message_id))
+        shard_message_ids.update(dict(result.all()))
+
+
+async def create_shard_message(bot: Bot, shard_key: str, text: str):
+    sent_message = await bot.send_message(
+        chat_id=GROUP_ID, text=text, parse_mode="HTML", disable_web_page_preview=True)
+    try:
+        await bot.pin_chat_message(chat_id=GROUP_ID, message_id=sent_message.message_id, disable_notification=True)
+    except Exception as e:
+        print(f"Could not pin dashboard shard {shard_key}: {e}")
+    async with async_session_factory() as session:
+        session.add(DashboardShard(shard_key=shard_key, message_id=sent_message.message_id))
+        await session.commit()
+    shard_message_ids[shard_key] = sent_message.message_id
+
+
+async def retire_shard_message(bot: Bot, shard_key: str, message_id: int):
+    # Шард опустевшей пары удаляем; сообщения старше 48 часов Telegram удалить
+    # не даст — тогда снимаем закреп и очищаем текст
+    try:
+        await bot.delete_message(chat_id=GROUP_ID, message_id=message_id)
+    except Exception:
+        try:
+            await bot.unpin_chat_message(chat_id=GROUP_ID, message_id=message_id)
+            await bot.edit_message_text(text="Активных заявок нет.", chat_id=GROUP_ID, message_id=message_id)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                print(f"Could not retire dashboard shard {shard_key}: {e}")
+        except Exception as e:
+            print(f"Could not retire dashboard shard {shard_key}: {e}")
+    async with async_session_factory() as session:
+        await session.execute(delete(DashboardShard).where(DashboardShard.shard_key == shard_key))
+        await session.commit()
+    shard_message_ids.pop(shard_key, None)
+    dashboard_renderer.last_sent.pop(shard_key, None)
+
+
+async def edit_dashboard_message(bot: Bot, key: str, message_id, text: str, reply_markup=None):
+    # Редактируем сообщение только если его текст изменился с прошлой отправки
+    if dashboard_renderer.last_sent.get(key) == text:
+        return
     try:
         await bot.edit_message_text(
             text=text,
             chat_id=GROUP_ID,
-            message_id=DASHBOARD_MESSAGE_ID,
+            message_id=message_id,
             parse_mode="HTML",
-            reply_markup=get_dashboard_kb(),
+            reply_markup=reply_markup,
             disable_web_page_preview=True
         )
+        dashboard_renderer.last_sent[key] = text
     except TelegramBadRequest as e:
         if "message is not modified" in str(e):
-            pass
+            dashboard_renderer.last_sent[key] = text
         else:
-            print(f"Failed to update dashboard: {e}")
+            print(f"Failed to update dashboard shard {key}: {e}")
     except Exception as e:
-        print(f"Failed to update dashboard: {e}")
+        print(f"Failed to update dashboard shard {key}: {e}")
+
+
+async def update_dashboard(bot: Bot):
+    if not order_book.loaded:
+        # Книга заявок еще грузится — перерисуем, когда она будет готова
+        schedule_dashboard_update(bot)
+        return
+    if not dashboard_renderer.loaded:
+        dashboard_renderer.load()
+    if not shard_message_ids:
+        await load_shard_message_ids()
+
+    shards = dashboard_renderer.render_shards()
+    for shard_key, text in shards.items():
+        if shard_key in shard_message_ids:
+            await edit_dashboard_message(bot, shard_key, shard_message_ids[shard_key], text)
+            continue
+        try:
+            await create_shard_message(bot, shard_key, text)
+            dashboard_renderer.last_sent[shard_key] = text
+        except Exception as e:
+            print(f"Failed to create dashboard shard {shard_key}: {e}")
+
+    # Лишние шарды (пара опустела или стала короче) не висят в закрепе пустыми
+    for shard_key, message_id in list(shard_message_ids.items()):
+        if shard_key not in shards:
+            try:
+                await retire_shard_message(bot, shard_key, message_id)
+            except Exception as e:
+                print(f"Failed to retire dashboard shard {shard_key}: {e}")
+
+    summary = dashboard_renderer.render_summary(shard_message_ids)
+    await edit_dashboard_message(bot, "summary", DASHBOARD_MESSAGE_ID, summary, reply_markup=get_dashboard_kb())
+
+
+class DashboardScheduler:
+    # Собирает все изменения за окно debounce в одну перерисовку
+    # и обновляет дашборд не чаще одного раза в min_interval секунд
+    def __init__(self, debounce: float = DASHBOARD_DEBOUNCE, min_interval: float = DASHBOARD_MIN_INTERVAL):
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self._bot = None
+        self._dirty = False
+        self._task = None
+        self._last_flush = 0.0
+
+    def mark_dirty(self, bot: Bot):
+        self._bot = bot
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            since_last = time.monotonic() - self._last_flush
+            await asyncio.sleep(max(self.debounce, self.min_interval - since_last))
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            try:
+                await update_dashboard(self._bot)
+            except Exception as e:
+                print(f"Failed to update dashboard: {e}")
+
+
+dashboard_scheduler = DashboardScheduler()
+
+
+def schedule_dashboard_update(bot: Bot):
+    dashboard_scheduler.mark_dirty(bot)
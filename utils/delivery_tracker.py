@@ -0,0 +1,90 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config import DELIVERY_MAX_FAILURES, DELIVERY_FLUSH_INTERVAL
+from db.database import async_session_factory
+from db.queries import RECORD_DELIVERED, RECORD_FAILED_DELIVERY
+from utils.user_registry import UserRegistry, user_registry
+
+# Ошибки, после которых сообщение этому пользователю не дойдет и при повторе
+UNREACHABLE_MARKERS = ("chat not found", "user not found", "peer_id_invalid")
+
+
+class DeliveryTracker:
+    # Итоги отправок в личку копятся в памяти и пишутся в users пачкой:
+    # delivered — успешные, failed — telegram_id -> blocked. Несколько неудач
+    # одного пользователя между записями считаются за одну.
+    # Сетевые ошибки и ошибки самого сообщения (например, разметки) пользователю
+    # не засчитываются
+    def __init__(self, max_failures: int = DELIVERY_MAX_FAILURES, flush_interval: float = DELIVERY_FLUSH_INTERVAL,
+                 registry: UserRegistry = user_registry):
+        self.max_failures = max_failures
+        self.flush_interval = flush_interval
+        self.registry = registry
+        self.delivered = set()
+        self.failed = {}
+        self._task = None
+
+    def record(self, telegram_id: int, error: Exception = None):
+        if error is None:
+            self.delivered.add(telegram_id)
+            self.failed.pop(telegram_id, None)
+            return
+        if isinstance(error, TelegramForbiddenError):
+            blocked = True
+        elif isinstance(error, TelegramBadRequest) and any(
+                marker in error.message.lower() for marker in UNREACHABLE_MARKERS):
+            blocked = False
+        else:
+            return
+        self.delivered.discard(telegram_id)
+        self.failed[telegram_id] = self.failed.get(telegram_id, False) or blocked
+
+    async def flush(self):
+        if not self.delivered and not self.failed:
+            return 0
+        delivered, self.delivered = self.delivered, set()
+        failed, self.failed = self.failed, {}
+        newly_blocked = []
+        try:
+            async with async_session_factory() as session:
+                if delivered:
+                    await session.execute(RECORD_DELIVERED, {'ids': list(delivered)})
+                for blocked in (True, False):
+                    ids = [telegram_id for telegram_id, is_blocked in failed.items() if is_blocked == blocked]
+                    if not ids:
+                        continue
+                    result = await session.execute(RECORD_FAILED_DELIVERY, {
+                        'ids': ids, 'blocked': blocked, 'max_failures': self.max_failures})
+                    newly_blocked += [row.telegram_id for row in result if row.is_blocked]
+                await session.commit()
+        except Exception:
+            # Итоги, пришедшие во время записи, новее — их не перетираем
+            self.delivered = (delivered - set(self.failed)) | self.delivered
+            self.failed = {**{telegram_id: blocked for telegram_id, blocked in failed.items()
+                              if telegram_id not in self.delivered}, **self.failed}
+            raise
+        # Заблокированный должен снова попасть в базу при следующем сообщении боту,
+        # чтобы UPSERT_USER вернул его в рассылки
+        self.registry.forget(newly_blocked)
+        return len(delivered) + len(failed)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush delivery results: {e}")
+
+
+delivery_tracker = DeliveryTracker()
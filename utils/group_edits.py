@@ -0,0 +1,98 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import GROUP_ID, GROUP_EDIT_RATE_PER_SEC
+from db.database import async_session_factory
+from db.queries import PENDING_GROUP_EDITS, MARK_GROUP_EDITED
+
+# Подпись под зачеркнутой заявкой по ее статусу
+CLOSE_REASONS = {'CLOSED': "Не актуально", 'EXPIRED': "Срок заявки истек"}
+
+
+def render_closed_text(author_mention: str, message_text: str, comment: str = None, reason: str = "Не актуально"):
+    original_body = f"👤 {author_mention} {message_text}"
+    if comment:
+        original_body += f"\n<b>Комментарий:</b> {comment}"
+    return (
+        f"<s>{original_body}</s>\n\n"
+        f"<b>--- {reason} ---</b>")
+
+
+class GroupEditQueue:
+    # Правки сообщений заявок в группе. Telegram ограничивает число сообщений
+    # в одну группу в минуту, поэтому правки идут одной очередью не быстрее
+    # rate_per_sec; повторная правка того же сообщения заменяет ожидающую.
+    # Очередь — только кэш: сделанная правка отмечается в requests.group_closed_at,
+    # а при старте незачеркнутые закрытые заявки снова берутся из базы
+    def __init__(self, rate_per_sec: float = GROUP_EDIT_RATE_PER_SEC):
+        self.rate_per_sec = rate_per_sec
+        self.pending = {}
+        self._wakeup = None
+        self._task = None
+
+    def enqueue(self, message_id: int, text: str, request_id: int = None):
+        self.pending[message_id] = (text, request_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def enqueue_closed(self, row, status: str):
+        # row — строка с id, message_text, comment, group_message_id, username, first_name
+        author_mention = f"@{row.username}" if row.username else row.first_name
+        self.enqueue(row.group_message_id,
+                     render_closed_text(author_mention, row.message_text, row.comment, CLOSE_REASONS[status]),
+                     request_id=row.id)
+
+    async def start(self, bot: Bot):
+        # Event создается внутри работающего цикла событий
+        self._wakeup = asyncio.Event()
+        async with async_session_factory() as session:
+            result = await session.execute(PENDING_GROUP_EDITS)
+            rows = result.all()
+        for row in rows:
+            self.enqueue_closed(row, row.status)
+        if rows:
+            print(f"Resuming {len(rows)} pending group edits")
+        self._task = asyncio.create_task(self._run(bot))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.pending:
+                message_id = next(iter(self.pending))
+                text, request_id = self.pending.pop(message_id)
+                if await self._edit(bot, message_id, text) and request_id is not None:
+                    await self._mark_edited(request_id)
+                await asyncio.sleep(1 / self.rate_per_sec)
+
+    async def _edit(self, bot: Bot, message_id: int, text: str):
+        # True — с правкой покончено (сделана или невозможна), False — стоит повторить позже
+        for _ in range(2):
+            try:
+                await bot.edit_message_text(text=text, chat_id=GROUP_ID, message_id=message_id, parse_mode="HTML")
+                return True
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                print(f"Could not edit group message {message_id}: {e}")
+                return True
+        return False
+
+    async def _mark_edited(self, request_id: int):
+        try:
+            async with async_session_factory() as session:
+                await session.execute(MARK_GROUP_EDITED, {'request_id': request_id})
+                await session.commit()
+        except Exception as e:
+            # Правка повторится после перезапуска — текст тот же, вреда нет
+            print(f"Could not mark group edit of request #{request_id} as done: {e}")
+
+
+group_edit_queue = GroupEditQueue()
@@ -0,0 +1,69 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import NOTIFY_BATCH_WINDOW, NOTIFY_RATE_PER_SEC
+from utils.dashboard_updater import render_request_line
+from utils.delivery_tracker import delivery_tracker
+
+
+class MatchNotifier:
+    # Очередь уведомлений авторам подходящих заявок: все новые заявки за окно
+    # batch_window собираются в одно сообщение на получателя и отправляются
+    # не быстрее rate_per_sec сообщений в секунду
+    def __init__(self, batch_window: float = NOTIFY_BATCH_WINDOW, rate_per_sec: float = NOTIFY_RATE_PER_SEC):
+        self.batch_window = batch_window
+        self.rate_per_sec = rate_per_sec
+        self.pending = {}
+        self._wakeup = None
+        self._task = None
+
+    def notify(self, recipient_ids, active_request):
+        for recipient_id in recipient_ids:
+            self.pending.setdefault(recipient_id, {})[active_request.id] = active_request
+        if self.pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot: Bot):
+        # Event создается внутри работающего цикла событий
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.batch_window)
+            self._wakeup.clear()
+            batch, self.pending = self.pending, {}
+            for recipient_id, requests in batch.items():
+                await self._send(bot, recipient_id, list(requests.values()))
+                await asyncio.sleep(1 / self.rate_per_sec)
+
+    async def _send(self, bot: Bot, recipient_id: int, requests):
+        text_parts = ["🔔 <b>Появились заявки, подходящие к вашей:</b>"]
+        text_parts += [render_request_line(req, req.author_mention) for req in requests]
+        text = "\n\n".join(text_parts)
+        # На RetryAfter ждем и повторяем, пока сообщение не уйдет или не случится
+        # настоящая ошибка — иначе уведомление терялось бы молча
+        while True:
+            try:
+                await bot.send_message(chat_id=recipient_id, text=text, parse_mode="HTML",
+                                       disable_web_page_preview=True)
+                delivery_tracker.record(recipient_id)
+                return
+            except TelegramRetryAfter as e:
+                print(f"Notifying {recipient_id} throttled, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                delivery_tracker.record(recipient_id, e)
+                print(f"Failed to notify {recipient_id} about matching requests: {e}")
+                return
+
+
+match_notifier = MatchNotifier()
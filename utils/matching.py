@@ -0,0 +1,105 @@
+from bisect import bisect_left, bisect_right
+
+from config import MATCH_AMOUNT_TOLERANCE, MATCH_MAX_PARTS
+
+BUCKET_FIELDS = ('request_type', 'currency_from', 'currency_to', 'money_type_from', 'money_type_to',
+                 'location_from', 'location_to')
+
+
+def bucket_key(req):
+    return tuple(getattr(req, field) for field in BUCKET_FIELDS)
+
+
+def sort_key(req):
+    return req.amount, req.created_at, req.id
+
+
+class MatchBucket:
+    # Заявки с одинаковыми параметрами обмена, отсортированные по сумме и времени
+    def __init__(self):
+        self.keys = []
+        self.amounts = []
+        self.requests = []
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, req):
+        key = sort_key(req)
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.amounts.insert(index, req.amount)
+        self.requests.insert(index, req)
+
+    def remove(self, req):
+        index = bisect_left(self.keys, sort_key(req))
+        if index < len(self.keys) and self.requests[index].id == req.id:
+            del self.keys[index]
+            del self.amounts[index]
+            del self.requests[index]
+
+    def nearest(self, amount: float, exclude_user_id: int = None, limit: int = None, low: float = None,
+                high: float = None):
+        # Расходимся от позиции суммы в обе стороны: ближайшие по сумме идут первыми.
+        # low/high ограничивают диапазон сумм, который просматривается
+        start = 0 if low is None else bisect_left(self.amounts, low)
+        end = len(self.amounts) if high is None else bisect_right(self.amounts, high)
+        right = min(max(bisect_left(self.amounts, amount), start), end)
+        left = right - 1
+        result = []
+        while (left >= start or right < end) and (limit is None or len(result) < limit):
+            if right >= end or (left >= start and amount - self.amounts[left] <= self.amounts[right] - amount):
+                req, left = self.requests[left], left - 1
+            else:
+                req, right = self.requests[right], right + 1
+            if req.user_id != exclude_user_id:
+                result.append(req)
+        return result
+
+    def partial_fill(self, amount: float, below: float, exclude_user_id: int = None, max_parts: int = MATCH_MAX_PARTS):
+        # Набираем сумму из заявок меньше below, начиная с самых крупных.
+        # Если max_parts заявок не покрывают сумму целиком, набора нет
+        index = bisect_left(self.amounts, below) - 1
+        remaining = amount
+        result = []
+        while index >= 0 and remaining > 0 and len(result) < max_parts:
+            req = self.requests[index]
+            index -= 1
+            if req.user_id == exclude_user_id:
+                continue
+            covered = min(req.amount, remaining)
+            result.append((req, covered))
+            remaining -= covered
+        return result if remaining <= 0 else []
+
+
+class MatchingEngine:
+    def __init__(self):
+        self.buckets = {}
+
+    def clear(self):
+        self.buckets = {}
+
+    def add(self, req):
+        self.buckets.setdefault(bucket_key(req), MatchBucket()).add(req)
+
+    def remove(self, req):
+        key = bucket_key(req)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        bucket.remove(req)
+        if not bucket:
+            del self.buckets[key]
+
+    def find_by_amount(self, key: tuple, amount: float, exclude_user_id: int = None,
+                       tolerance: float = MATCH_AMOUNT_TOLERANCE, max_parts: int = MATCH_MAX_PARTS):
+        # Сначала заявки с суммой в пределах ±tolerance, затем набор из более мелких заявок.
+        # Возвращает пары (заявка, какую часть суммы она покрывает)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return []
+        low, high = amount * (1 - tolerance), amount * (1 + tolerance)
+        in_range = bucket.nearest(amount, exclude_user_id, low=low, high=high)
+        partial = bucket.partial_fill(amount, low, exclude_user_id, max_parts)
+        return [(req, min(req.amount, amount)) for req in in_range] + partial
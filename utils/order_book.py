@@ -0,0 +1,124 @@
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from db.database import async_session_factory
+from db.models import Request
+from utils.matching import MatchingEngine
+from utils.routes import RouteFinder, request_nodes
+
+
+class ActiveRequest:
+    # Легкая копия строки requests вместе с данными автора, живет в памяти процесса
+    __slots__ = ('id', 'user_id', 'request_type', 'currency_from', 'money_type_from', 'location_from', 'amount',
+                 'currency_to', 'money_type_to', 'location_to', 'comment', 'group_message_id', 'message_text',
+                 'created_at', 'username', 'first_name')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_model(cls, req: Request, username: str, first_name: str, created_at: datetime = None):
+        return cls(
+            id=req.id,
+            user_id=req.user_id,
+            request_type=req.request_type,
+            currency_from=req.currency_from,
+            money_type_from=req.money_type_from,
+            location_from=req.location_from,
+            amount=float(req.amount),
+            currency_to=req.currency_to,
+            money_type_to=req.money_type_to,
+            location_to=req.location_to,
+            comment=req.comment,
+            group_message_id=req.group_message_id,
+            message_text=req.message_text,
+            created_at=created_at or req.created_at,
+            username=username,
+            first_name=first_name)
+
+    @property
+    def author_mention(self):
+        return f"@{self.username}" if self.username else self.first_name
+
+
+class OrderBook:
+    def __init__(self):
+        self.requests = {}
+        self.matching = MatchingEngine()
+        self.routes = RouteFinder()
+        self.loaded = False
+        self._journal = None
+
+    async def load(self):
+        # add/remove, пришедшие пока идет запрос, пишутся в журнал и применяются
+        # поверх загруженного снимка, а не теряются при его подстановке
+        self._journal = []
+        try:
+            async with async_session_factory() as session:
+                query = (
+                    select(Request)
+                    .where(Request.status == 'ACTIVE')
+                    .options(selectinload(Request.user))
+                    .order_by(Request.created_at.asc())
+                )
+                result = await session.execute(query)
+                requests = result.scalars().all()
+        finally:
+            journal, self._journal = self._journal, None
+
+        self.requests = {}
+        self.matching.clear()
+        self.routes.clear()
+        for req in requests:
+            self.add(ActiveRequest.from_model(req, req.user.username, req.user.first_name))
+        for apply, arg in journal:
+            apply(arg)
+        self.loaded = True
+
+    def add(self, active_request: ActiveRequest):
+        if self._journal is not None:
+            self._journal.append((self.add, active_request))
+        previous = self.requests.get(active_request.id)
+        if previous is not None:
+            # Заявка из журнала уже попала в снимок — заменяем, а не дублируем
+            self.matching.remove(previous)
+            self.routes.remove(previous)
+        self.requests[active_request.id] = active_request
+        self.matching.add(active_request)
+        self.routes.add(active_request)
+        return active_request
+
+    def remove(self, request_id: int):
+        if self._journal is not None:
+            self._journal.append((self.remove, request_id))
+        active_request = self.requests.pop(request_id, None)
+        if active_request is not None:
+            self.matching.remove(active_request)
+            self.routes.remove(active_request)
+        return active_request
+
+    def get(self, request_id: int):
+        return self.requests.get(request_id)
+
+    def active(self):
+        # Порядок вставки совпадает с порядком created_at
+        return list(self.requests.values())
+
+    def find_amount_matches(self, user_id: int, request_type: str, currency_from: str, currency_to: str,
+                            money_type_from: str, money_type_to: str, location_from: str, location_to: str,
+                            amount: float):
+        key = (request_type, currency_from, currency_to, money_type_from, money_type_to, location_from, location_to)
+        return self.matching.find_by_amount(key, amount, exclude_user_id=user_id)
+
+    def find_routes(self, user_id: int, request_type: str, currency_from: str, currency_to: str,
+                    money_type_from: str, money_type_to: str, location_from: str, location_to: str,
+                    amount: float, rate_matrix):
+        gives, wants = request_nodes(request_type, currency_from, money_type_from, location_from,
+                                     currency_to, money_type_to, location_to)
+        return self.routes.find(gives, wants, amount, currency_from, rate_matrix, user_id)
+
+
+order_book = OrderBook()
@@ -0,0 +1,97 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import GROUP_ID, OUTBOX_POLL_INTERVAL, OUTBOX_BATCH_SIZE
+from db.database import async_session_factory
+from db.queries import CLAIM_OUTBOX_BATCH, SET_GROUP_MESSAGE_IDS, DELETE_OUTBOX_ROWS
+from utils.dashboard_updater import dashboard_renderer, schedule_dashboard_update
+from utils.group_edits import group_edit_queue
+from utils.order_book import order_book
+
+
+class OutboxPublisher:
+    # Публикует новые заявки в группу из таблицы group_outbox. Строка удаляется
+    # только после успешной отправки, поэтому сбой Telegram не теряет публикацию
+    def __init__(self, poll_interval: float = OUTBOX_POLL_INTERVAL, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = None
+        self._task = None
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot: Bot):
+        # Event создается внутри работающего цикла событий
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            try:
+                published = await self.publish_batch(bot)
+            except Exception as e:
+                print(f"Outbox publisher failed: {e}")
+                published = 0
+            if published >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def publish_batch(self, bot: Bot):
+        async with async_session_factory() as session:
+            result = await session.execute(CLAIM_OUTBOX_BATCH, {"limit": self.batch_size})
+            rows = result.all()
+            await session.commit()
+        if not rows:
+            return 0
+
+        published = []
+        for row in rows:
+            try:
+                sent_message = await bot.send_message(chat_id=GROUP_ID, text=row.text, parse_mode="HTML")
+            except TelegramRetryAfter as e:
+                # Остальные строки пачки вернутся в работу по своему next_attempt_at
+                print(f"Group publishing throttled for {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+                break
+            except Exception as e:
+                print(f"Error sending request #{row.request_id} to group (attempt {row.attempts}): {e}")
+                continue
+            published.append((row.id, row.request_id, sent_message.message_id))
+
+        if published:
+            async with async_session_factory() as session:
+                result = await session.execute(SET_GROUP_MESSAGE_IDS, {
+                    "request_ids": [request_id for _, request_id, _ in published],
+                    "message_ids": [message_id for _, _, message_id in published]})
+                stored = result.all()
+                await session.execute(DELETE_OUTBOX_ROWS, {"ids": [outbox_id for outbox_id, _, _ in published]})
+                await session.commit()
+
+            # Заявку закрыли, пока сообщение уходило в группу — сразу зачеркиваем его
+            for row in stored:
+                if row.status != 'ACTIVE':
+                    group_edit_queue.enqueue_closed(row, row.status)
+
+            for _, request_id, message_id in published:
+                active_request = order_book.get(request_id)
+                if active_request is not None:
+                    active_request.group_message_id = message_id
+                    dashboard_renderer.add(active_request)
+            schedule_dashboard_update(bot)
+        return len(published)
+
+
+outbox_publisher = OutboxPublisher()
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class RateMatrix:
+    # Все попарные курсы считаются один раз на снимок:
+    # rates[i, j] — сколько единиц валюты j дают за 1 единицу валюты i (через TJS)
+    def __init__(self, rates: dict):
+        self.codes = np.array(sorted(rates))
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        buy = np.array([rates[code]['buy'] for code in self.codes], dtype=float)
+        sell = np.array([rates[code]['sell'] for code in self.codes], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.rates = buy[:, None] / sell[None, :]
+        self.rates[~np.isfinite(self.rates)] = np.nan
+        np.fill_diagonal(self.rates, 1.0)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def _indices(self, codes):
+        # Вектор кодов -> вектор индексов; неизвестные коды помечаются -1
+        codes = np.asarray(codes)
+        idx = np.searchsorted(self.codes, codes)
+        idx = np.clip(idx, 0, len(self.codes) - 1)
+        return np.where(self.codes[idx] == codes, idx, -1)
+
+    def rate(self, from_curr, to_curr):
+        if from_curr not in self.index or to_curr not in self.index:
+            return None
+        value = self.rates[self.index[from_curr], self.index[to_curr]]
+        return None if np.isnan(value) else float(value)
+
+    def convert_many(self, amounts, from_curr, to_curr):
+        # from_curr/to_curr — один код или массив кодов той же длины, что и amounts
+        amounts = np.asarray(amounts, dtype=float)
+        i = self._indices(from_curr)
+        j = self._indices(to_curr)
+        result = amounts * self.rates[i, j]
+        return np.where((i < 0) | (j < 0), np.nan, result)
+
+    def convert(self, amount, from_curr, to_curr):
+        direct_rate = self.rate(from_curr, to_curr)
+        if direct_rate is None:
+            return None, None
+        return round(amount * direct_rate, 2), round(direct_rate, 4)
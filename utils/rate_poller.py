@@ -0,0 +1,84 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from sqlalchemy import select, insert, delete, func
+
+from config import RATES_POLL_INTERVAL, RATES_RETENTION_DAYS, RATES_PRUNE_INTERVAL
+from db.database import async_session_factory, read_session
+from db.models import RateSnapshot
+from utils.rates_client import rate_provider, get_rates
+from utils.rate_matrix import RateMatrix
+
+latest_rates = None
+latest_matrix = None
+
+
+async def get_current_rates():
+    # Пока поллер не получил первый снимок, берем снимок провайдера (с диска или из сети)
+    return latest_rates or await get_rates()
+
+
+async def get_current_matrix():
+    global latest_rates, latest_matrix
+    if latest_matrix is None:
+        rates = await get_current_rates()
+        if not rates:
+            return None
+        latest_rates, latest_matrix = rates, RateMatrix(rates)
+    return latest_matrix
+
+
+async def save_snapshot(rates):
+    rows = [{"currency": code, "buy": rate["buy"], "sell": rate["sell"]}
+            for code, rate in rates.items() if code != 'TJS']
+    async with async_session_factory() as session:
+        await session.execute(insert(RateSnapshot), rows)
+        await session.commit()
+
+
+async def prune_snapshots(keep: timedelta = timedelta(days=RATES_RETENTION_DAYS)):
+    async with async_session_factory() as session:
+        result = await session.execute(delete(RateSnapshot).where(RateSnapshot.created_at < func.now() - keep))
+        await session.commit()
+    return result.rowcount
+
+
+async def get_rates_ago(delta: timedelta):
+    # Последний снимок по каждой валюте, сделанный не позже чем delta назад
+    async with read_session() as session:
+        result = await session.execute(
+            select(RateSnapshot)
+            .where(RateSnapshot.created_at <= func.now() - delta)
+            .distinct(RateSnapshot.currency)
+            .order_by(RateSnapshot.currency, RateSnapshot.created_at.desc()))
+        snapshots = result.scalars().all()
+    return {s.currency: {"buy": float(s.buy), "sell": float(s.sell)} for s in snapshots}
+
+
+async def poll_rates_once():
+    global latest_rates, latest_matrix
+    rates = await rate_provider.refresh()
+    if not rates:
+        return
+    latest_rates, latest_matrix = rates, RateMatrix(rates)
+    try:
+        await save_snapshot(rates)
+    except Exception as e:
+        print(f"Could not save rate snapshot: {e}")
+
+
+async def run_rate_poller(interval: int = RATES_POLL_INTERVAL, prune_interval: int = RATES_PRUNE_INTERVAL):
+    last_pruned = None
+    while True:
+        await poll_rates_once()
+        # Снимки пишутся каждый опрос, старые чистим реже — раз в prune_interval
+        if last_pruned is None or time.monotonic() - last_pruned >= prune_interval:
+            last_pruned = time.monotonic()
+            try:
+                pruned = await prune_snapshots()
+                if pruned:
+                    print(f"Pruned {pruned} old rate snapshots")
+            except Exception as e:
+                print(f"Failed to prune rate snapshots: {e}")
+        await asyncio.sleep(interval)
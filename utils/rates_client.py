@@ -0,0 +1,198 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import os
+import time
+
+import aiofiles
+import aiohttp
+
+from config import (RATES_URL, RATES_CACHE_TTL, RATES_TIMEOUT, RATES_CACHE_PATH,
+                    RATES_BREAKER_THRESHOLD, RATES_BREAKER_RESET)
+
+SUPPORTED_CURRENCIES = ["USD", "RUB", "EUR", "UZS", "KZT"]
+
+_session = None
+
+
+def get_session():
+    # Одна сессия на весь процесс: keep-alive соединения к API переиспользуются
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=RATES_TIMEOUT))
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+class RateSource(ABC):
+    # Источник курсов: fetch возвращает {"USD": {"buy": ..., "sell": ...}, ...}
+    # или бросает исключение — тогда провайдер переходит к следующему источнику
+    name = "base"
+
+    @abstractmethod
+    async def fetch(self, session: aiohttp.ClientSession) -> dict:
+        ...
+
+
+class AlifRateSource(RateSource):
+    def __init__(self, url: str = RATES_URL, name: str = "alif"):
+        self.url = url
+        self.name = name
+
+    async def fetch(self, session: aiohttp.ClientSession) -> dict:
+        async with session.get(self.url) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return parse_alif_rates(data)
+
+
+def parse_alif_rates(data):
+    rates = {}
+    for currency_data in data.get("localRates", []):
+        name = currency_data.get("name")
+        if name in SUPPORTED_CURRENCIES:
+            rates[name] = {
+                "buy": float(currency_data.get("buyValue", 0)),
+                "sell": float(currency_data.get("sellValue", 0)),
+            }
+    if not rates:
+        raise ValueError("response has no known currencies")
+    rates['TJS'] = {'buy': 1.0, 'sell': 1.0}
+    return rates
+
+
+class CircuitBreaker:
+    # После threshold ошибок подряд источник пропускается reset_timeout секунд,
+    # затем пропускается одна пробная попытка (half-open)
+    def __init__(self, threshold: int = RATES_BREAKER_THRESHOLD, reset_timeout: float = RATES_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        return not self.is_open
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class RateProvider:
+    def __init__(self, sources, ttl: float = RATES_CACHE_TTL, cache_path: str = RATES_CACHE_PATH):
+        self.sources = list(sources)
+        self.breakers = {source.name: CircuitBreaker() for source in self.sources}
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.rates = None
+        self.source_name = None
+        self.fetched_at = 0.0
+        self._inflight = None
+        self._loading = None
+        self._loaded = False
+
+    def is_fresh(self):
+        return self.rates is not None and time.time() - self.fetched_at < self.ttl
+
+    async def load(self):
+        # Холодный старт: берем последний удачный снимок с диска, без сети.
+        # Флаг ставится только после чтения, иначе одновременные первые
+        # вызовы пошли бы в сеть, не дождавшись снимка
+        try:
+            if not self.cache_path or not os.path.exists(self.cache_path):
+                return
+            async with aiofiles.open(self.cache_path, encoding="utf-8") as f:
+                snapshot = json.loads(await f.read())
+            self.rates = snapshot["rates"]
+            self.source_name = snapshot.get("source")
+            self.fetched_at = float(snapshot["fetched_at"])
+        except Exception as e:
+            print(f"Could not load rates snapshot from {self.cache_path}: {e}")
+        finally:
+            self._loaded = True
+
+    async def ensure_loaded(self):
+        # Все первые вызовы ждут одно и то же чтение снимка
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self.load())
+        await asyncio.shield(self._loading)
+
+    async def save(self):
+        if not self.cache_path:
+            return
+        snapshot = {"rates": self.rates, "source": self.source_name, "fetched_at": self.fetched_at}
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+                await f.write(json.dumps(snapshot))
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Could not save rates snapshot to {self.cache_path}: {e}")
+
+    async def _fetch_from_sources(self):
+        session = get_session()
+        for source in self.sources:
+            breaker = self.breakers[source.name]
+            if not breaker.allow():
+                continue
+            try:
+                rates = await source.fetch(session)
+            except Exception as e:
+                breaker.record_failure()
+                print(f"Could not get rates from {source.name}: {e}")
+                continue
+            breaker.record_success()
+            return source.name, rates
+        return None, None
+
+    async def _refresh(self):
+        try:
+            source_name, rates = await self._fetch_from_sources()
+            if rates:
+                self.rates, self.source_name, self.fetched_at = rates, source_name, time.time()
+                await self.save()
+            return rates
+        finally:
+            self._inflight = None
+
+    def refresh_in_background(self):
+        # Все одновременные запросы ждут один и тот же запрос к источникам
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        return self._inflight
+
+    async def refresh(self):
+        return await asyncio.shield(self.refresh_in_background())
+
+    async def get_rates(self):
+        if not self._loaded:
+            await self.ensure_loaded()
+        if self.is_fresh():
+            return self.rates
+        if self.rates is not None:
+            # stale-while-revalidate: отдаем последний снимок сразу, обновляем в фоне
+            self.refresh_in_background()
+            return self.rates
+        return await self.refresh()
+
+
+rate_provider = RateProvider([AlifRateSource()])
+
+
+async def get_rates():
+    return await rate_provider.get_rates()
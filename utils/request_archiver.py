@@ -0,0 +1,82 @@
+import asyncio
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from config import ARCHIVE_INTERVAL, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from db.database import async_engine
+
+HISTORY_COLUMNS = ("id, user_id, request_type, currency_from, money_type_from, location_from, amount, "
+                   "currency_to, money_type_to, location_to, comment, status, group_message_id, message_text, "
+                   "created_at, closed_at, expires_at")
+
+# Заявки с незачеркнутым сообщением в группе остаются в requests, пока правка не пройдет
+ARCHIVABLE = ("status <> 'ACTIVE' AND closed_at < now() - CAST(:older_than AS interval) "
+              "AND (group_message_id IS NULL OR group_closed_at IS NOT NULL)")
+
+ARCHIVABLE_MONTHS = text(f"""
+    SELECT date_trunc('month', min(closed_at)), date_trunc('month', max(closed_at))
+    FROM requests WHERE {ARCHIVABLE}
+""")
+
+# Переносим пачку одним выражением: DELETE ... RETURNING сразу вставляется в архив.
+# Заявки, чья публикация еще ждет в group_outbox, не трогаем — на них ссылается FK
+MOVE_BATCH = text(f"""
+    WITH moved AS (
+        DELETE FROM requests
+        WHERE id IN (
+            SELECT id FROM requests
+            WHERE {ARCHIVABLE}
+              AND NOT EXISTS (SELECT 1 FROM group_outbox WHERE group_outbox.request_id = requests.id)
+            ORDER BY closed_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {HISTORY_COLUMNS}
+    )
+    INSERT INTO requests_history ({HISTORY_COLUMNS})
+    SELECT {HISTORY_COLUMNS} FROM moved
+""")
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+async def ensure_history_partitions(conn, older_than: timedelta):
+    result = await conn.execute(ARCHIVABLE_MONTHS, {"older_than": older_than})
+    first_month, last_month = result.one()
+    if first_month is None:
+        return
+    month = first_month.date()
+    while month <= last_month.date():
+        partition = f"requests_history_{month:%Y_%m}"
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF requests_history "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"))
+        month = next_month(month)
+
+
+async def archive_closed_requests(older_than: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+                                  batch_size: int = ARCHIVE_BATCH_SIZE):
+    async with async_engine.begin() as conn:
+        await ensure_history_partitions(conn, older_than)
+
+    total = 0
+    while True:
+        async with async_engine.begin() as conn:
+            result = await conn.execute(MOVE_BATCH, {"older_than": older_than, "batch_size": batch_size})
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+async def run_request_archiver(interval: int = ARCHIVE_INTERVAL):
+    while True:
+        try:
+            archived = await archive_closed_requests()
+            if archived:
+                print(f"Archived {archived} closed requests")
+        except Exception as e:
+            print(f"Failed to archive closed requests: {e}")
+        await asyncio.sleep(interval)
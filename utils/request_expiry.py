@@ -0,0 +1,39 @@
+import asyncio
+
+from aiogram import Bot
+
+from config import EXPIRY_CHECK_INTERVAL
+from db.database import async_session_factory
+from db.queries import EXPIRE_DUE_REQUESTS
+from utils.dashboard_updater import dashboard_renderer, schedule_dashboard_update
+from utils.group_edits import group_edit_queue
+from utils.order_book import order_book
+
+
+async def expire_due_requests(bot: Bot):
+    async with async_session_factory() as session:
+        result = await session.execute(EXPIRE_DUE_REQUESTS)
+        expired = result.all()
+        await session.commit()
+    if not expired:
+        return 0
+
+    for row in expired:
+        order_book.remove(row.id)
+        dashboard_renderer.remove(row.id)
+        if row.group_message_id:
+            group_edit_queue.enqueue_closed(row, 'EXPIRED')
+    # Одно обновление дашборда на всю пачку
+    schedule_dashboard_update(bot)
+    return len(expired)
+
+
+async def run_request_expiry(bot: Bot, interval: int = EXPIRY_CHECK_INTERVAL):
+    while True:
+        try:
+            expired = await expire_due_requests(bot)
+            if expired:
+                print(f"Expired {expired} requests")
+        except Exception as e:
+            print(f"Failed to expire requests: {e}")
+        await asyncio.sleep(interval)
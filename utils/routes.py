@@ -0,0 +1,73 @@
+import numpy as np
+
+from config import ROUTE_MAX_HOPS, ROUTE_MAX_BRANCH, ROUTE_AMOUNT_TOLERANCE, ROUTE_LIMIT
+
+
+def request_nodes(request_type, currency_from, money_type_from, location_from,
+                  currency_to, money_type_to, location_to):
+    # Узел графа — (валюта, вид денег, город). Возвращает пару (что автор отдает, что получает)
+    from_node = (currency_from, money_type_from, location_from)
+    to_node = (currency_to, money_type_to, location_to)
+    return (from_node, to_node) if request_type == "give" else (to_node, from_node)
+
+
+def nodes_of(req):
+    return request_nodes(req.request_type, req.currency_from, req.money_type_from, req.location_from,
+                         req.currency_to, req.money_type_to, req.location_to)
+
+
+class RouteFinder:
+    # Активные заявки как ребра графа: заявка, автору которой нужен узел X и
+    # который отдает узел Y, — это ребро X -> Y. Цепочка ребер от того, что
+    # отдает пользователь, к тому, что ему нужно, закрывает его заявку
+    def __init__(self):
+        self.edges = {}
+
+    def clear(self):
+        self.edges = {}
+
+    def add(self, req):
+        gives, wants = nodes_of(req)
+        self.edges.setdefault(wants, {})[req.id] = req
+
+    def remove(self, req):
+        gives, wants = nodes_of(req)
+        node_edges = self.edges.get(wants)
+        if node_edges is not None:
+            node_edges.pop(req.id, None)
+            if not node_edges:
+                del self.edges[wants]
+
+    def _candidates(self, node, amount, currency, rate_matrix, exclude_user_ids, tolerance, max_branch):
+        # Оставляем только заявки, чья сумма в валюте пользователя близка к его сумме,
+        # и не больше max_branch лучших — так перебор ограничен max_branch ** max_hops
+        reqs = [req for req in self.edges.get(node, {}).values() if req.user_id not in exclude_user_ids]
+        if not reqs:
+            return []
+        values = rate_matrix.convert_many([req.amount for req in reqs], [req.currency_from for req in reqs], currency)
+        deviations = np.abs(values - amount) / amount
+        order = np.argsort(deviations)[:max_branch]
+        return [(reqs[i], float(deviations[i])) for i in order if deviations[i] <= tolerance]
+
+    def find(self, gives, wants, amount, currency, rate_matrix, user_id,
+             max_hops=ROUTE_MAX_HOPS, tolerance=ROUTE_AMOUNT_TOLERANCE, max_branch=ROUTE_MAX_BRANCH,
+             limit=ROUTE_LIMIT):
+        if rate_matrix is None or not amount or currency not in rate_matrix:
+            return []
+        routes = []
+
+        def expand(node, path, score, visited):
+            exclude_user_ids = {user_id} | {req.user_id for req in path}
+            for req, deviation in self._candidates(node, amount, currency, rate_matrix, exclude_user_ids,
+                                                   tolerance, max_branch):
+                next_node = nodes_of(req)[0]
+                route_score = max(score, deviation)
+                if next_node == wants:
+                    if path:
+                        routes.append((route_score, path + [req]))
+                elif len(path) + 1 < max_hops and next_node not in visited:
+                    expand(next_node, path + [req], route_score, visited | {next_node})
+
+        expand(gives, [], 0.0, {gives})
+        routes.sort(key=lambda route: (route[0], len(route[1])))
+        return [path for _, path in routes[:limit]]
@@ -0,0 +1,82 @@
+import asyncio
+from collections import OrderedDict
+
+from config import USER_CACHE_SIZE, USER_FLUSH_INTERVAL
+from db.database import async_session_factory
+from db.queries import UPSERT_USER
+
+
+class UserRegistry:
+    # Кэш недавно виденных пользователей: telegram_id -> (username, first_name).
+    # Новый пользователь сразу записывается в users (на строку ссылаются заявки),
+    # а смена имени у уже известного копится в pending и пишется пачкой
+    def __init__(self, max_size: int = USER_CACHE_SIZE, flush_interval: float = USER_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.known = OrderedDict()
+        self.pending = {}
+        self._task = None
+
+    async def touch(self, telegram_id: int, username: str, first_name: str):
+        profile = (username, first_name)
+        cached = self.known.get(telegram_id)
+        if cached is None:
+            try:
+                async with async_session_factory() as session:
+                    await session.execute(UPSERT_USER, self._params(telegram_id, profile))
+                    await session.commit()
+            except Exception as e:
+                # Апдейт не теряем: строка уйдет в users со следующей пачкой
+                print(f"Failed to register user {telegram_id}, queued for the next flush: {e}")
+                self.pending[telegram_id] = profile
+        elif cached != profile:
+            self.pending[telegram_id] = profile
+
+        self.known[telegram_id] = profile
+        self.known.move_to_end(telegram_id)
+        if len(self.known) > self.max_size:
+            self.known.popitem(last=False)
+
+    def forget(self, telegram_ids):
+        # Следующее сообщение этих пользователей снова пройдет через UPSERT_USER
+        for telegram_id in telegram_ids:
+            self.known.pop(telegram_id, None)
+
+    async def flush(self):
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            async with async_session_factory() as session:
+                await session.execute(
+                    UPSERT_USER, [self._params(telegram_id, profile) for telegram_id, profile in batch.items()])
+                await session.commit()
+        except Exception:
+            # Более свежие изменения, пришедшие во время записи, не перетираем
+            self.pending = {**batch, **self.pending}
+            raise
+        return len(batch)
+
+    @staticmethod
+    def _params(telegram_id: int, profile):
+        username, first_name = profile
+        return {'telegram_id': telegram_id, 'username': username, 'first_name': first_name}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to flush user profile changes: {e}")
+
+
+user_registry = UserRegistry()